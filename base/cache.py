@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+
+class CacheEntry:
+    def __init__(self, key, url, status_code, headers, encoding, stored_at, body_path):
+        self.key = key
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.encoding = encoding
+        self.stored_at = stored_at
+        self.body_path = body_path
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.stored_at < ttl
+
+    def validators(self) -> dict:
+        """
+        :return: Returns the conditional request headers the server can use to answer with *304 Not Modified*.
+        """
+        validators = {}
+        if 'ETag' in self.headers:
+            validators['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            validators['If-Modified-Since'] = self.headers['Last-Modified']
+
+        return validators
+
+    def to_response(self) -> Response:
+        response = Response()
+        response.status_code = self.status_code
+        response.reason = 'OK'
+        response.url = self.url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        with open(self.body_path, 'rb') as body_file:
+            response._content = body_file.read()
+        response.from_cache = True
+
+        return response
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache. Bodies are stored as files named after a hash of the request, and an SQLite index
+    keeps their headers, age and last access time for TTL checks, revalidation and least-recently-used eviction.
+    """
+    index_file_name = 'index.sqlite'
+
+    def __init__(self, directory: str = 'output/http_cache', max_size: int = 2 * 1024 ** 3):
+        """
+        :param directory: Directory holding the index and the response bodies.
+        :param max_size: Total body size in bytes above which the least recently used entries are evicted.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(self.directory, self.index_file_name),
+                                           check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                 'key TEXT PRIMARY KEY, method TEXT, url TEXT, status_code INTEGER, headers TEXT, '
+                                 'encoding TEXT, size INTEGER, stored_at REAL, accessed_at REAL)')
+        self._connection.commit()
+        self._total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def key(method: str, url: str, data=None) -> str:
+        if isinstance(data, dict):
+            data = json.dumps(data, sort_keys=True)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        digest = hashlib.sha256(f'{method.upper()} {url}\n'.encode('utf-8'))
+        digest.update(data or b'')
+
+        return digest.hexdigest()
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.body')
+
+    def get(self, key: str):
+        """
+        :param key: Request key from `key()`.
+        :return: Returns the cached CacheEntry, or None if the request has not been cached.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT url, status_code, headers, encoding, stored_at FROM responses '
+                                           'WHERE key = ?', (key,)).fetchone()
+            if not row:
+                return None
+
+            body_path = self._body_path(key)
+            if not os.path.exists(body_path):
+                self._delete(key)
+                self._connection.commit()
+                return None
+
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+
+        url, status_code, headers, encoding, stored_at = row
+        return CacheEntry(key, url, status_code, json.loads(headers), encoding, stored_at, body_path)
+
+    def put(self, key: str, method: str, response: Response):
+        body = response.content
+        body_path = self._body_path(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+        partial_body_path = f'{body_path}.{threading.get_ident()}.part'
+        with open(partial_body_path, 'wb') as body_file:
+            body_file.write(body)
+        os.replace(partial_body_path, body_path)
+
+        now = time.time()
+        with self._lock:
+            previous = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                     (key, method.upper(), response.url, response.status_code,
+                                      json.dumps(dict(response.headers)), response.encoding, len(body), now, now))
+            self._connection.commit()
+            self._total_size += len(body) - (previous[0] if previous else 0)
+
+            if self._total_size > self.max_size:
+                self._evict()
+
+    def touch(self, key: str):
+        """
+        Marks an entry as fresh again after the server confirmed it is unchanged.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?',
+                                     (now, now, key))
+            self._connection.commit()
+
+    def _evict(self):
+        # Evict down to 90% of the limit so a full cache doesn't evict again on every write.
+        target_size = self.max_size * 0.9
+        keys = self._connection.execute('SELECT key FROM responses ORDER BY accessed_at').fetchall()
+        for key, in keys:
+            if self._total_size <= target_size:
+                break
+            self._delete(key)
+
+        self._connection.commit()
+
+    def _delete(self, key: str):
+        row = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if row:
+            self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._total_size -= row[0]
+        try:
+            os.remove(self._body_path(key))
+        except FileNotFoundError:
+            pass
@@ -1,7 +1,12 @@
 from abc import abstractmethod, ABC
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 class CrawlingStrategy(ABC):
+    max_workers = 1  # Work items the crawler runs at once
+    min_request_interval = 0.0  # Seconds between the starts of two requests when scheduled with other websites
+
     @abstractmethod
     def download(self, url, timeout=10, headers=None, cookies=None, data=None):
         pass
@@ -9,3 +14,48 @@ class CrawlingStrategy(ABC):
     @abstractmethod
     def crawl(self):
         pass
+
+    @abstractmethod
+    def discover(self, urls=None) -> list:
+        """
+        First half of `crawl()`, for work-queue mode: finds the URLs of the applications to fetch.
+        :param urls: Application URLs to use instead of searching for them.
+        :return: Returns the application URLs.
+        """
+        pass
+
+    @abstractmethod
+    def fetch(self, url: str):
+        """
+        Second half of `crawl()`, for work-queue mode: fetches a single application.
+        :param url: Application URL returned by `discover()`.
+        :return: Returns the raw record, or None if there is nothing to parse.
+        """
+        pass
+
+    @staticmethod
+    def map_ordered(func, items, max_workers: int, prefetch: int = None):
+        """
+        Lazily applies `func` to `items` on a thread pool, yielding results in input order. At most `prefetch` items
+        are in flight or waiting to be consumed at once, so memory stays bounded however many items there are.
+        :param func: Function to call with each item.
+        :param items: Iterable of items.
+        :param max_workers: Number of worker threads. Use 1 to run serially in the calling thread.
+        :param prefetch: Maximum number of results held ahead of the consumer *(defaults to twice `max_workers`)*.
+        :return: Yields `func(item)` for each item.
+        """
+        if max_workers <= 1:
+            for item in items:
+                yield func(item)
+            return
+
+        prefetch = max(prefetch or max_workers * 2, max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= prefetch:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
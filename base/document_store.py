@@ -0,0 +1,111 @@
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from base.metrics import metrics
+
+
+class DocumentStore:
+    """
+    Content-addressed store for downloaded documents. Bodies are streamed to disk in chunks and named after their
+    SHA-256, so identical documents are stored once, and raw records only carry a small reference to the file.
+    An SQLite index remembers which URL produced which document so re-runs can skip downloads.
+    """
+    index_file_name = 'index.sqlite'
+    chunk_size = 64 * 1024
+
+    def __init__(self, directory: str = 'output/documents'):
+        # References carry absolute paths, so raw records can be parsed from any working directory.
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(self.directory, self.index_file_name),
+                                           check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS documents ('
+                                 'url TEXT PRIMARY KEY, sha256 TEXT, size INTEGER, stored_at REAL)')
+        self._connection.commit()
+
+    def _document_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], f'{sha256}.pdf')
+
+    def lookup(self, url: str, ttl: float = None):
+        """
+        :param url: URL the document was downloaded from.
+        :param ttl: Maximum age in seconds of the stored document. None accepts any age.
+        :return: Returns the reference of the stored document, or None if it has to be downloaded.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT sha256, size, stored_at FROM documents WHERE url = ?',
+                                           (url,)).fetchone()
+        if not row:
+            return None
+
+        sha256, size, stored_at = row
+        if ttl is not None and time.time() - stored_at >= ttl:
+            return None
+
+        reference = {'path': self._document_path(sha256), 'sha256': sha256, 'size': size}
+        return reference if os.path.exists(reference['path']) else None
+
+    def save(self, url: str, chunks):
+        """
+        :param url: URL the document was downloaded from.
+        :param chunks: Iterable of byte chunks, e.g. `response.iter_content()`.
+        :return: Returns a {'path', 'sha256', 'size'} reference to the stored document, or None if it was empty.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        partial_path = os.path.join(self.directory, f'{threading.get_ident()}.{time.monotonic_ns()}.part')
+        try:
+            with open(partial_path, 'wb') as document_file:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        document_file.write(chunk)
+                        size += len(chunk)
+
+            if not size:
+                return None
+
+            sha256 = digest.hexdigest()
+            document_path = self._document_path(sha256)
+            os.makedirs(os.path.dirname(document_path), exist_ok=True)
+            if os.path.exists(document_path):
+                os.remove(partial_path)
+                metrics.increment('documents_stored_total', result='duplicate')
+            else:
+                os.replace(partial_path, document_path)
+                metrics.increment('documents_stored_total', result='new')
+            metrics.increment('document_bytes_total', size)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)',
+                                     (url, sha256, size, time.time()))
+            self._connection.commit()
+
+        return {'path': document_path, 'sha256': sha256, 'size': size}
+
+
+@contextmanager
+def open_document(document_data):
+    """
+    :param document_data: A DocumentStore reference, or the document bytes themselves for older raw records.
+    :return: Yields a read-only, seekable stream of the document. Stored files are memory-mapped, so pages are only
+    read from disk as they are accessed.
+    """
+    if isinstance(document_data, (bytes, bytearray)):
+        yield io.BytesIO(document_data)
+        return
+
+    with open(document_data['path'], 'rb') as document_file:
+        with mmap.mmap(document_file.fileno(), 0, access=mmap.ACCESS_READ) as document_map:
+            yield document_map
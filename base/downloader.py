@@ -1,37 +1,314 @@
+import copy
+import threading
+import time
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
 import requests
-from requests.exceptions import HTTPError, ConnectionError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, RequestException, Timeout
+
+from base.cache import ResponseCache
+from base.metrics import metrics
+from base.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from base.scheduler import AdaptiveLimiter
+
+
+class ConnectionPools:
+    """
+    Keep-alive connection pools, one HTTP adapter per host. Adapters are thread-safe and can be mounted on any number
+    of sessions, so every Downloader sharing a ConnectionPools reuses the same open connections and only pays for the
+    TLS handshake once per connection.
+    """
+    default_pool_size = 10
+
+    def __init__(self, pool_sizes: dict = None):
+        """
+        :param pool_sizes: Maps a hostname to the number of connections kept open to it.
+        """
+        self.pool_sizes = dict(pool_sizes or {})
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host: str, size: int):
+        """
+        Makes sure the pool for `host` keeps at least `size` connections, so that many requests can be in flight
+        without connections being discarded and reopened. Only applies to pools that are not created yet.
+        """
+        with self._lock:
+            self.pool_sizes[host] = max(self.pool_sizes.get(host, self.default_pool_size), size)
 
-from retrying import retry
+    def get_adapter(self, host: str) -> HTTPAdapter:
+        with self._lock:
+            adapter = self._adapters.get(host)
+            if adapter is None:
+                # Retries are handled by the Downloader's retry policy.
+                pool_size = self.pool_sizes.get(host, self.default_pool_size)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+                self._adapters[host] = adapter
+
+        return adapter
+
+    def close(self):
+        with self._lock:
+            for adapter in self._adapters.values():
+                adapter.close()
+            self._adapters.clear()
+
+
+# Shared by every Downloader that isn't given its own pools.
+shared_pools = ConnectionPools()
 
 
 class Downloader:
-    max_retries = 5
-    retry_delay = 5000  # In milliseconds
+    default_host_limit = 4  # Maximum in-flight requests per host
+    overload_statuses = frozenset({429, 500, 502, 503, 504})
 
-    def __init__(self):
+    def __init__(self, host_limits: dict = None, cache: ResponseCache = None, retry_policy: RetryPolicy = None,
+                 failure_threshold: int = 5, reset_timeout: float = 60.0, pools: ConnectionPools = None,
+                 url_rewrites: dict = None, limiter=None, adaptive: bool = True):
+        """
+        :param host_limits: Maps a hostname to the maximum number of requests allowed in flight to it at once.
+        Hosts not listed fall back to `default_host_limit`. With `adaptive`, this is the ceiling of the host's
+        adaptive limit.
+        :param cache: Response cache used by requests that pass a `cache_ttl`.
+        :param retry_policy: Decides which failures are retried and the backoff between attempts.
+        :param failure_threshold: Consecutive host failures after which requests to that host fail fast.
+        :param reset_timeout: Seconds a host fails fast for before a probe request is let through.
+        :param pools: Connection pools to send requests through. Defaults to the process-wide `shared_pools`.
+        :param url_rewrites: Maps a URL prefix to the prefix requests are actually sent to, e.g. to point a crawler at
+        a local replay server. Host limits, circuit breakers and the cache still use the original URL.
+        :param limiter: Optional budget shared with other work, e.g. a `SiteLimiter` of the scheduler. Every request
+        holds one of its `slot()`s on top of its host slot.
+        :param adaptive: Adapt the in-flight requests of each host to its latency and overload responses, see
+        `AdaptiveLimiter`. False always allows `host_limits`.
+        """
         self.requester = requests.Session()
         self.requester.verify = False
+        self.pools = pools or shared_pools
+        self.url_rewrites = url_rewrites or {}
+        self.limiter = limiter
+        self._mounted_prefixes = set()
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._circuit_breakers = {}
 
-    @retry(stop_max_attempt_number=max_retries, wait_fixed=retry_delay, retry_on_exception=ConnectionError)
-    def get(self, url, timeout=100, headers=None, cookies=None):
-        try:
-            response = self.requester.get(url, timeout=timeout, headers=headers, cookies=cookies)
-            response.raise_for_status()
+        self.host_limits = host_limits or {}
+        self.adaptive = adaptive
+        self._host_limiters = {}
+        self._hosts_lock = threading.Lock()
 
-            return response
-        except ConnectionError:
-            raise ConnectionError
-        except HTTPError:
-            raise HTTPError
+        for host, limit in self.host_limits.items():
+            self.pools.reserve(host, limit)
+
+    def fork(self):
+        """
+        :return: Returns a Downloader with its own session *(cookies)* that shares this one's connection pools, cache,
+        adaptive per-host limits and circuit breakers. Use it for work that needs a separate server-side session.
+        """
+        downloader = copy.copy(self)
+        downloader.requester = requests.Session()
+        downloader.requester.verify = self.requester.verify
+        downloader._mounted_prefixes = set()
+
+        return downloader
+
+    def _rewrite(self, url: str) -> str:
+        for prefix, replacement in self.url_rewrites.items():
+            if url.startswith(prefix):
+                return f'{replacement}{url[len(prefix):]}'
+
+        return url
+
+    def _mount(self, url):
+        url_parts = urlsplit(url)
+        prefix = f'{url_parts.scheme}://{url_parts.netloc}/'
+        if prefix in self._mounted_prefixes:
+            return
+
+        with self._hosts_lock:
+            if prefix not in self._mounted_prefixes:
+                self.requester.mount(prefix, self.pools.get_adapter(url_parts.hostname))
+                self._mounted_prefixes.add(prefix)
+
+    def _get_host_limiter(self, host: str) -> AdaptiveLimiter:
+        with self._hosts_lock:
+            host_limiter = self._host_limiters.get(host)
+            if host_limiter is None:
+                host_limit = self.host_limits.get(host, self.default_host_limit)
+                host_limiter = AdaptiveLimiter(host_limit, min_limit=1 if self.adaptive else host_limit)
+                self._host_limiters[host] = host_limiter
+
+        return host_limiter
+
+    def _get_circuit_breaker(self, host: str) -> CircuitBreaker:
+        with self._hosts_lock:
+            circuit_breaker = self._circuit_breakers.get(host)
+            if circuit_breaker is None:
+                circuit_breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._circuit_breakers[host] = circuit_breaker
+
+        return circuit_breaker
+
+    def get(self, url, timeout=100, headers=None, cookies=None, cache_ttl=None, stream=False):
+        return self._request('GET', url, timeout=timeout, headers=headers, cookies=cookies, cache_ttl=cache_ttl,
+                             stream=stream)
+
+    def post(self, url, timeout=100, headers=None, cookies=None, data=None, cache_ttl=None, stream=False):
+        return self._request('POST', url, timeout=timeout, headers=headers, cookies=cookies, data=data,
+                             cache_ttl=cache_ttl, stream=stream)
+
+    def _request(self, method, url, timeout=100, headers=None, cookies=None, data=None, cache_ttl=None,
+                 stream=False):
+        """
+        Serves the request from the response cache when possible. Stale entries are revalidated with the server's
+        ETag/Last-Modified validators, so an unchanged page costs a *304 Not Modified* instead of a full body.
+        :param cache_ttl: Seconds a cached response stays fresh. None bypasses the cache, which is what requests
+        depending on server-side session state *(search postbacks, pagination)* need.
+        :param stream: Return as soon as the headers arrive and leave the body to be read with `iter_content()`.
+        Streamed responses bypass the cache, since caching them would read the whole body into memory. They hold their
+        host slot until closed, so always close them, e.g. with `with response:`.
+        """
+        if self.cache is None or cache_ttl is None or stream:
+            return self._send(method, url, timeout=timeout, headers=headers, cookies=cookies, data=data,
+                              stream=stream)
+
+        host = urlsplit(url).hostname
+        key = self.cache.key(method, url, data)
+        entry = self.cache.get(key)
+        if entry and entry.is_fresh(cache_ttl):
+            metrics.increment('http_cache_requests_total', host=host, result='hit')
+            return entry.to_response()
+
+        if entry:
+            headers = {**(headers or {}), **entry.validators()}
+
+        response = self._send(method, url, timeout=timeout, headers=headers, cookies=cookies, data=data)
+        if entry and response.status_code == 304:
+            metrics.increment('http_cache_requests_total', host=host, result='revalidated')
+            self.cache.touch(key)
+            return entry.to_response()
+
+        metrics.increment('http_cache_requests_total', host=host, result='miss')
+        if response.status_code == 200:
+            self.cache.put(key, method, response)
+
+        return response
+
+    @staticmethod
+    def _release_on_close(response, release):
+        """
+        Makes closing a streamed response call `release()`, once, so its slots are held until the body has been read.
+        """
+        close = response.close
+        is_released = False
+
+        def close_and_release():
+            nonlocal is_released
+            try:
+                close()
+            finally:
+                if not is_released:
+                    is_released = True
+                    release()
+
+        response.close = close_and_release
+
+    def _timed_request(self, method, url, request_url, stream=False, **kwargs):
+        """
+        Sends a single request while holding a slot of the host limiter and of `limiter`. A streamed response holds
+        them until it's closed, so bodies read after the headers still count towards the limits.
+        """
+        host = urlsplit(url).hostname
+        host_limiter = self._get_host_limiter(host)
+        wait_start_time = time.perf_counter()
+        request_start_time = None
+        status = 'error'
+        overload_reason = None
+        slots = ExitStack()
+        started_at = host_limiter.acquire()
+
+        def release(latency=None):
+            slots.close()
+            if host_limiter.release(started_at, latency, overload_reason is not None):
+                metrics.increment('http_concurrency_decreases_total', host=host, reason=overload_reason)
+            metrics.set_gauge('http_concurrency_limit', round(host_limiter.limit, 2), host=host)
 
-    @retry(stop_max_attempt_number=max_retries, wait_fixed=retry_delay, retry_on_exception=ConnectionError)
-    def post(self, url, timeout=100, headers=None, cookies=None, data=None):
         try:
-            response = self.requester.post(url, timeout=timeout, headers=headers, cookies=cookies, data=data)
-            response.raise_for_status()
+            if self.limiter:
+                slots.enter_context(self.limiter.slot())
+            # Time spent waiting for slots is recorded on its own, so that latencies only measure the server.
+            request_start_time = time.perf_counter()
+            metrics.observe('http_slot_wait_seconds', request_start_time - wait_start_time, host=host)
+            response = self.requester.request(method, request_url, stream=stream, **kwargs)
+            latency = time.perf_counter() - request_start_time
+            status = response.status_code
+            if status in self.overload_statuses:
+                overload_reason = status
+
+            if stream:
+                # The slots are held until the body has been read, but the latency signal stays the time to the
+                # headers, as for other responses. Body transfers scale with the document's size, not server load.
+                self._release_on_close(response, lambda: release(latency))
+            else:
+                release(latency)
 
             return response
-        except ConnectionError:
-            raise ConnectionError()
-        except HTTPError:
-            raise HTTPError
+        except (ConnectionError, Timeout) as e:
+            overload_reason = e.__class__.__name__
+            raise
+        finally:
+            # Requests that didn't get a response release their slots here.
+            if status == 'error':
+                release()
+            if request_start_time is not None:
+                metrics.observe('http_request_duration_seconds', time.perf_counter() - request_start_time, host=host,
+                                method=method, status=status)
+
+    def _send(self, method, url, timeout=100, headers=None, cookies=None, data=None, stream=False):
+        """
+        Sends the request, retrying failures the retry policy classifies as transient. The host slot is released
+        while backing off, and requests to a host whose circuit breaker is open fail fast with CircuitOpenError.
+        """
+        host = urlsplit(url).hostname
+        circuit_breaker = self._get_circuit_breaker(host)
+        request_url = self._rewrite(url)
+        self._mount(request_url)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                circuit_breaker.before_request(host)
+            except CircuitOpenError:
+                metrics.increment('http_circuit_open_total', host=host)
+                raise
+
+            try:
+                response = self._timed_request(method, url, request_url, timeout=timeout, headers=headers,
+                                               cookies=cookies, data=data, stream=stream)
+                # Streamed bodies are counted by whoever reads them.
+                if not stream:
+                    metrics.increment('http_response_bytes_total', len(response.content), host=host)
+                response.raise_for_status()
+                circuit_breaker.record_success()
+
+                return response
+            except RequestException as e:
+                if stream and getattr(e, 'response', None) is not None:
+                    # Hand the unread connection back to the pool.
+                    e.response.close()
+
+                if self.retry_policy.is_host_failure(e):
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success()
+
+                if attempt >= self.retry_policy.max_attempts or not self.retry_policy.should_retry(e):
+                    raise
+
+                metrics.increment('http_retries_total', host=host, reason=getattr(e.response, 'status_code', None)
+                                  or e.__class__.__name__)
+                time.sleep(self.retry_policy.get_delay(attempt, e))
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+import time
+
+from base.raw_store import RawRecordCodec
+
+
+class CrawlJournal:
+    """
+    Write-ahead journal of a crawl in progress. It records the search windows paginated so far and the application
+    URLs they listed, and every raw record as soon as it has been fetched. A crawl restarted after a crash replays
+    finished windows and records from the journal and only fetches what is missing. The journal is cleared once a
+    crawl has yielded every record.
+    """
+
+    def __init__(self, file_path: str = 'output/crawl_journal.sqlite'):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._codec = RawRecordCodec()
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        # WAL makes every commit a cheap append, and a crash mid-write never corrupts what was committed before it.
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS windows ('
+                                 'window TEXT PRIMARY KEY, pages INTEGER, is_complete INTEGER)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, window TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS records ('
+                                 'url TEXT PRIMARY KEY, data BLOB, listing_fingerprint TEXT, '
+                                 'details_fingerprint TEXT, completed_at REAL)')
+        self._connection.commit()
+
+    def get_value(self, key: str):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+
+        return row[0] if row else None
+
+    def set_value(self, key: str, value: str):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (key, value))
+            self._connection.commit()
+
+    def add_window_page(self, window: str, page: int, application_urls: list):
+        """
+        :param window: Search window the page belongs to.
+        :param page: Number of the page, starting at 1.
+        :param application_urls: Application URLs listed on the page.
+        """
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO windows VALUES (?, ?, 0)', (window, page))
+            self._connection.executemany('INSERT OR IGNORE INTO urls VALUES (?, ?)',
+                                         ((url, window) for url in application_urls))
+            self._connection.commit()
+
+    def complete_window(self, window: str):
+        with self._lock:
+            self._connection.execute('INSERT OR IGNORE INTO windows VALUES (?, 0, 0)', (window,))
+            self._connection.execute('UPDATE windows SET is_complete = 1 WHERE window = ?', (window,))
+            self._connection.commit()
+
+    def get_window_urls(self, window: str):
+        """
+        :return: Returns the application URLs of a completely paginated window in the order found, or None if the
+        window hasn't been completed.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT is_complete FROM windows WHERE window = ?', (window,)).fetchone()
+            if not row or not row[0]:
+                return None
+
+            return [url for url, in self._connection.execute('SELECT url FROM urls WHERE window = ? ORDER BY rowid',
+                                                             (window,))]
+
+    def add_record(self, url: str, raw_data, listing_fingerprint: str = None, details_fingerprint: str = None):
+        """
+        :param url: Application URL.
+        :param raw_data: Raw record fetched for it. None records an application that was skipped.
+        """
+        data = None if raw_data is None else self._codec.encode(raw_data)
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)',
+                                     (url, data, listing_fingerprint, details_fingerprint, time.time()))
+            self._connection.commit()
+
+    def get_completed_urls(self) -> set:
+        with self._lock:
+            return {url for url, in self._connection.execute('SELECT url FROM records')}
+
+    def get_record(self, url: str) -> tuple:
+        """
+        :return: Returns a (raw_data, listing_fingerprint, details_fingerprint) tuple of a completed application.
+        """
+        with self._lock:
+            data, listing_fingerprint, details_fingerprint = self._connection.execute(
+                'SELECT data, listing_fingerprint, details_fingerprint FROM records WHERE url = ?', (url,)).fetchone()
+
+        return None if data is None else self._codec.decode(data), listing_fingerprint, details_fingerprint
+
+    def get_progress(self) -> dict:
+        with self._lock:
+            return {
+                'windows': self._connection.execute('SELECT COUNT(*) FROM windows WHERE is_complete').fetchone()[0],
+                'urls': self._connection.execute('SELECT COUNT(*) FROM urls').fetchone()[0],
+                'records': self._connection.execute('SELECT COUNT(*) FROM records').fetchone()[0],
+            }
+
+    def clear(self):
+        with self._lock:
+            for table in ('settings', 'windows', 'urls', 'records'):
+                self._connection.execute(f'DELETE FROM {table}')
+            self._connection.commit()
@@ -1,27 +1,181 @@
 from datetime import datetime
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 
+import atexit
+import itertools
+import json
 import logging
+import os
+import queue
+import threading
 
+# Pass as `extra=SAMPLED` on per-page lines, so they can be thinned out with `configure(sample_every=...)`.
+SAMPLED = {'sampled': True}
 
-class Logger:
-    def __init__(self, class_name):
-        self.logger = logging.getLogger(class_name)
-        self.logger.setLevel(logging.DEBUG)
+_lock = threading.Lock()
+_settings = {'level': logging.DEBUG, 'json_format': False, 'sample_every': {}, 'directory': 'logs'}
+_logger_names = set()
+_queue_handler = None
+_output_handlers = []
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps every n-th record of a level among those logged with `extra=SAMPLED`. Other records always pass.
+    """
+
+    def __init__(self, sample_every: dict):
+        super().__init__()
+        self.sample_every = sample_every
+        self._counters = {level: itertools.count() for level in sample_every}
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or record.levelno not in self._counters:
+            return True
 
-        # File handler to log messages to a file
-        log_file = f"logs/{datetime.today().strftime('%Y-%m-%d')}.log"
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
+        return next(self._counters[record.levelno]) % self.sample_every[record.levelno] == 0
 
-        # Console handler to log messages to the console
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.DEBUG)
 
-        # Formatter for the handlers
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Records for the in-process listener are formatted on its thread, not the caller's. Records crossing a
+        # process boundary have to be formatted first, so they can be pickled.
+        if isinstance(self.queue, queue.SimpleQueue):
+            return record
+
+        return super().prepare(record)
+
+
+def _create_output_handlers() -> list:
+    os.makedirs(_settings['directory'], exist_ok=True)
+    log_file = os.path.join(_settings['directory'], f"{datetime.today().strftime('%Y-%m-%d')}.log")
+    # Delayed, so a process that never logs, e.g. a parse worker, doesn't open the file.
+    file_handler = logging.FileHandler(log_file, delay=True)
+    console_handler = logging.StreamHandler()
+
+    if _settings['json_format']:
+        formatter = JsonFormatter()
+    else:
         formatter = logging.Formatter('[%(asctime)s] - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
 
-        # Add the handlers to the logger
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    return [file_handler, console_handler]
+
+
+def _start_listener():
+    global _listener, _output_handlers
+    _output_handlers = _create_output_handlers()
+    _listener = QueueListener(_queue_handler.queue, *_output_handlers)
+    _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener:
+        # Stopping drains the queue first, so nothing logged before exit is lost.
+        _listener.stop()
+        _listener = None
+        for handler in _output_handlers:
+            handler.close()
+
+
+def _get_queue_handler() -> QueueHandler:
+    global _queue_handler
+    if _queue_handler is None:
+        _queue_handler = _QueueHandler(queue.SimpleQueue())
+        _queue_handler.addFilter(SamplingFilter(_settings['sample_every']))
+        _start_listener()
+        atexit.register(_stop_listener)
+
+    return _queue_handler
+
+
+def configure(level: int = None, json_format: bool = None, sample_every: dict = None, directory: str = None):
+    """
+    Changes the process-wide logging settings. Loggers that already exist pick up the new settings.
+    :param level: Minimum level logged.
+    :param json_format: Write one JSON object per line instead of plain text.
+    :param sample_every: Maps a level to n, so only every n-th `extra=SAMPLED` record of that level is kept.
+    :param directory: Directory of the daily log files.
+    """
+    with _lock:
+        for key, value in (('level', level), ('json_format', json_format), ('sample_every', sample_every),
+                           ('directory', directory)):
+            if value is not None:
+                _settings[key] = value
+
+        handler = _get_queue_handler()
+        handler.filters = [SamplingFilter(_settings['sample_every'])]
+        if isinstance(handler.queue, queue.SimpleQueue):
+            _stop_listener()
+            _start_listener()
+
+        for name in _logger_names:
+            logging.getLogger(name).setLevel(_settings['level'])
+
+
+@contextmanager
+def worker_queue(context):
+    """
+    Forwards records logged by worker processes to this process' log outputs, for as long as the block runs.
+    :param context: Multiprocessing context the workers are started with.
+    :return: Yields the settings to pass to `configure_worker()` in each worker.
+    """
+    _get_queue_handler()
+    log_queue = context.Queue()
+    listener = QueueListener(log_queue, *_output_handlers)
+    listener.start()
+    try:
+        yield {'queue': log_queue, 'level': _settings['level'], 'sample_every': _settings['sample_every']}
+    finally:
+        listener.stop()
+
+
+def configure_worker(worker_settings: dict):
+    """
+    Sends everything this worker process logs to the parent's queue from `worker_queue()`.
+    """
+    with _lock:
+        handler = _get_queue_handler()
+        _stop_listener()
+        handler.queue = worker_settings['queue']
+        handler.filters = [SamplingFilter(worker_settings['sample_every'])]
+        _settings['level'] = worker_settings['level']
+        for name in _logger_names:
+            logging.getLogger(name).setLevel(_settings['level'])
+
+
+class Logger:
+    """
+    Named logger writing to the daily log file and the console. Records are handed to a queue and written by a
+    background thread, so logging doesn't block the caller on I/O. Every instance of a name shares one handler,
+    however many times it's created.
+    """
+
+    def __init__(self, class_name):
+        self.logger = logging.getLogger(class_name)
+
+        with _lock:
+            handler = _get_queue_handler()
+            self.logger.setLevel(_settings['level'])
+            if handler not in self.logger.handlers:
+                self.logger.addHandler(handler)
+            _logger_names.add(class_name)
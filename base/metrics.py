@@ -0,0 +1,184 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'max': round(self.max, 6),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ('+Inf',), self.bucket_counts)},
+        }
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and latency histograms, keyed by metric name and labels. Exported as a JSON summary
+    and in the Prometheus text format, at the end of a run and optionally every few seconds during it.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._export_thread = None
+        self._export_stop = threading.Event()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observes the duration of the block in seconds, whether or not it raises.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def get_gauge(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._gauges.get(self._key(name, labels))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            gauges = [{'name': name, 'labels': dict(labels), 'value': value}
+                      for (name, labels), value in sorted(self._gauges.items())]
+            histograms = [{'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+
+        cache_requests = {counter['labels'].get('result'): counter['value'] for counter in counters
+                          if counter['name'] == 'http_cache_requests_total'}
+        cache_total = sum(cache_requests.values())
+        cache_reused = cache_requests.get('hit', 0) + cache_requests.get('revalidated', 0)
+
+        return {
+            'generated_at': time.time(),
+            'summary': {'cache_hit_rate': round(cache_reused / cache_total, 4) if cache_total else None},
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        def format_labels(labels, extra=None):
+            labels = list(labels) + (extra or [])
+            if not labels:
+                return ''
+            escaped = [(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                       for key, value in labels]
+            return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} counter')
+                    typed.add(name)
+                lines.append(f'{name}{format_labels(labels)} {value}')
+
+            for (name, labels), value in sorted(self._gauges.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} gauge')
+                    typed.add(name)
+                lines.append(f'{name}{format_labels(labels)} {value}')
+
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} histogram')
+                    typed.add(name)
+
+                cumulative_count = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.bucket_counts):
+                    cumulative_count += count
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", str(bound))])} {cumulative_count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, directory: str = 'output', name: str = 'metrics'):
+        """
+        Writes `<name>.json` and `<name>.prom` to `directory`. Files are replaced atomically, so a scraper never reads
+        a half-written file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for extension, content in (('json', json.dumps(self.snapshot(), indent=2)), ('prom', self.to_prometheus())):
+            file_path = os.path.join(directory, f'{name}.{extension}')
+            with open(f'{file_path}.part', 'w') as metrics_file:
+                metrics_file.write(content)
+            os.replace(f'{file_path}.part', file_path)
+
+    def start_periodic_export(self, interval: float, directory: str = 'output', name: str = 'metrics'):
+        def export_periodically():
+            while not self._export_stop.wait(interval):
+                self.export(directory, name)
+
+        self._export_stop.clear()
+        self._export_thread = threading.Thread(target=export_periodically, daemon=True)
+        self._export_thread.start()
+
+    def stop_periodic_export(self):
+        if self._export_thread:
+            self._export_stop.set()
+            self._export_thread.join()
+            self._export_thread = None
+
+
+metrics = Metrics()
@@ -1,7 +1,103 @@
+import multiprocessing
+import os
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from base.logger import Logger, configure_worker, worker_queue
+from base.metrics import metrics
+
+# Strategy instance owned by each worker process of a parallel parse.
+_worker_strategy = None
+
+
+def _init_worker(strategy, log_settings):
+    global _worker_strategy
+    configure_worker(log_settings)
+    _worker_strategy = strategy
+
+
+def _parse_chunk(raw_data_chunk: list) -> list:
+    return [_worker_strategy.parse_record(raw_data) for raw_data in raw_data_chunk]
 
 
 class ParsingStrategy(ABC):
+    # Output field -> key of the raw record page it's read from. None for fields that don't need a page.
+    field_sources = {}
+
+    @classmethod
+    def get_required_pages(cls, fields) -> set:
+        """
+        :param fields: Output fields a run needs.
+        :return: Returns the keys of the raw record pages those fields are read from, for the crawler to fetch.
+        """
+        unknown_fields = [field for field in fields if field not in cls.field_sources]
+        if unknown_fields:
+            raise ValueError(f'Unknown fields for {cls.__name__}: {", ".join(unknown_fields)}')
+
+        return {cls.field_sources[field] for field in fields} - {None}
+
     @abstractmethod
-    def parse(self, raw_data):
+    def parse_record(self, raw_data):
+        """
+        :param raw_data: A single raw record produced by the matching crawling strategy.
+        :return: Returns the parsed record, or None to drop it from the output.
+        """
         pass
+
+    def parse(self, raw_data, processes: int = 1, chunksize: int = 16):
+        """
+        :param raw_data: Iterable of raw records. It is consumed lazily, so a generator from `crawl()` works.
+        :param processes: Number of worker processes. 1 parses in the current process, None uses every CPU core.
+        :param chunksize: Number of records sent to a worker at a time when parsing in parallel.
+        :return: Yields parsed records in input order.
+        """
+        if processes == 1:
+            parsed_records = map(self._timed_parse_record, raw_data)
+        else:
+            parsed_records = self._parse_parallel(raw_data, processes, chunksize)
+
+        for data in parsed_records:
+            if data is not None:
+                yield data
+
+    def _timed_parse_record(self, raw_data):
+        # Workers of a parallel parse keep their own metrics, so only serial parses are recorded in this process.
+        with metrics.timer('parse_record_duration_seconds'):
+            return self.parse_record(raw_data)
+
+    def _parse_parallel(self, raw_data, processes: int, chunksize: int):
+        """
+        Spreads chunks of raw records over a process pool. Only a few chunks per worker are pending at once, so the
+        input is still consumed lazily and memory stays bounded.
+        """
+        raw_data = iter(raw_data)
+        processes = processes or os.cpu_count()
+        # Spawned workers start clean instead of inheriting the locks of a parent that may be running crawler threads.
+        context = multiprocessing.get_context('spawn')
+        with worker_queue(context) as log_settings, \
+                ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                                    initargs=(self, log_settings)) as executor:
+            max_pending = processes * 2
+            pending = deque()
+            while True:
+                raw_data_chunk = list(islice(raw_data, chunksize))
+                if raw_data_chunk:
+                    pending.append(executor.submit(_parse_chunk, raw_data_chunk))
+
+                if pending and (len(pending) >= max_pending or not raw_data_chunk):
+                    yield from pending.popleft().result()
+                elif not raw_data_chunk:
+                    break
+
+    def __getstate__(self):
+        # Loggers and their handlers stay in the parent process. Workers log through the parent's queue instead.
+        state = self.__dict__.copy()
+        state.pop('logger', None)
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = Logger(self.__class__.__name__).logger
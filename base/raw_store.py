@@ -0,0 +1,177 @@
+import os
+import pickle
+import re
+import zlib
+from collections import Counter
+
+from base.records import RawApplication
+
+RAW_STORE_FORMAT = 'compressed-raw-records'
+RAW_STORE_VERSION = 1
+
+# ASP.NET form state the parser never reads. It's the bulk of a Northgate page and doesn't compress.
+FORM_STATE_PATTERN = re.compile(r'(<input[^>]*?name="__(?:VIEWSTATE|EVENTVALIDATION)"[^>]*?value=")[^"]*(")',
+                                re.IGNORECASE)
+
+
+def strip_form_state(page: str) -> str:
+    return FORM_STATE_PATTERN.sub(r'\1\2', page)
+
+
+def train_dictionary(pages: list, size: int = 32 * 1024) -> bytes:
+    """
+    Builds a zlib preset dictionary out of the lines most sample pages share, i.e. the council's page chrome, so that
+    every page compresses as if the chrome had already been seen.
+    :param pages: Sample pages.
+    :param size: Maximum dictionary size. zlib uses at most 32 KiB.
+    :return: Returns the dictionary, empty if there are no samples.
+    """
+    line_counts = Counter()
+    for page in pages:
+        line_counts.update({line.strip() for line in page.splitlines() if line.strip()})
+
+    threshold = max(1, len(pages) // 2)
+    dictionary = b''
+    # zlib reaches strings near the end of the dictionary with the shortest distances, so the most shared lines go last.
+    for line, count in line_counts.most_common():
+        encoded_line = f'{line}\n'.encode()
+        if count < threshold or len(dictionary) + len(encoded_line) > size:
+            break
+        dictionary = encoded_line + dictionary
+
+    return dictionary
+
+
+class RawRecordCodec:
+    """
+    Encodes raw records to compact bytes and back. Long string values *(pages)* are stripped of form state and
+    compressed with a shared preset dictionary. Everything else is kept as is.
+    """
+    min_page_size = 1024  # Shorter strings aren't worth compressing
+
+    def __init__(self, dictionary: bytes = b''):
+        self.dictionary = dictionary
+
+    def _compress(self, page: str) -> bytes:
+        compressor = zlib.compressobj(9, zdict=self.dictionary) if self.dictionary else zlib.compressobj(9)
+        return compressor.compress(strip_form_state(page).encode()) + compressor.flush()
+
+    def encode(self, raw_data) -> bytes:
+        values = {}
+        pages = {}
+        for key, value in raw_data.items():
+            if isinstance(value, str) and len(value) >= self.min_page_size:
+                pages[key] = self._compress(value)
+            else:
+                values[key] = value
+
+        return pickle.dumps((list(raw_data), values, pages), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes):
+        # The field order stored ahead of the values isn't needed, since a RawApplication's fields are fixed.
+        _, values, pages = pickle.loads(data)
+        return RawRecord(values, pages, dictionary=self.dictionary)
+
+
+class RawRecord(RawApplication):
+    """
+    Raw application whose pages are decompressed the first time they're read, so a parser skipping a page never pays
+    for it. A page still compressed has its slot unset, which routes the first read to `__getattr__()`.
+    """
+    __slots__ = ('_pages', '_dictionary')
+
+    def __init__(self, values: dict, pages: dict, dictionary: bytes = b''):
+        for field, value in values.items():
+            setattr(self, field, value)
+        self._pages = pages
+        self._dictionary = dictionary
+
+    def __getattr__(self, field):
+        if field.startswith('_') or field not in self._fields:
+            raise AttributeError(field)
+
+        value = None
+        page = self._pages.pop(field, None)
+        if page is not None:
+            decompressor = zlib.decompressobj(zdict=self._dictionary) if self._dictionary else zlib.decompressobj()
+            value = decompressor.decompress(page).decode()
+        setattr(self, field, value)
+
+        return value
+
+    def __reduce__(self):
+        # Pickled with its pages still compressed, e.g. when it's sent to a parse worker process.
+        values = {field: getattr(self, field) for field in self._fields if field not in self._pages}
+        return self.__class__, (values, self._pages, self._dictionary)
+
+
+def write_raw_records(raw_data_iter, file_path: str, sample_size: int = 8):
+    """
+    Writes each raw record compressed as it passes through. The first `sample_size` records train the compression
+    dictionary, which is written ahead of them. The file is only moved into place once the iterator is exhausted, so
+    an interrupted crawl never leaves a partial file behind to be mistaken for a complete one.
+    :param raw_data_iter: Iterable of raw records.
+    :param file_path: File to write.
+    :param sample_size: Number of records the dictionary is trained on.
+    :return: Yields the raw records unchanged.
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    partial_file_path = f'{file_path}.part'
+    samples = []
+    codec = None
+    with open(partial_file_path, 'wb') as raw_file:
+        def write_header():
+            pages = [strip_form_state(value) for raw_data in samples for value in raw_data.values()
+                     if isinstance(value, str) and len(value) >= RawRecordCodec.min_page_size]
+            header_codec = RawRecordCodec(train_dictionary(pages))
+            pickle.dump((RAW_STORE_FORMAT, RAW_STORE_VERSION, header_codec.dictionary), raw_file)
+            for sample in samples:
+                pickle.dump(header_codec.encode(sample), raw_file)
+
+            return header_codec
+
+        for raw_data in raw_data_iter:
+            if codec:
+                pickle.dump(codec.encode(raw_data), raw_file)
+            else:
+                samples.append(raw_data)
+                if len(samples) >= sample_size:
+                    codec = write_header()
+                    samples.clear()
+
+            yield raw_data
+
+        if not codec:
+            write_header()
+
+    os.replace(partial_file_path, file_path)
+
+
+def read_raw_records(file_path: str):
+    """
+    :param file_path: File written by `write_raw_records()`.
+    :return: Yields raw records one at a time, as lazily decoded `RawRecord`s. Uncompressed pickle files of older
+    versions, including files holding a single pickled list, are still supported, and their dictionaries are read
+    as `RawApplication`s.
+    """
+    with open(file_path, 'rb') as raw_file:
+        codec = None
+        while True:
+            try:
+                raw_data = pickle.load(raw_file)
+            except EOFError:
+                break
+
+            if codec:
+                yield codec.decode(raw_data)
+            elif isinstance(raw_data, tuple) and raw_data[:1] == (RAW_STORE_FORMAT,):
+                if raw_data[1] > RAW_STORE_VERSION:
+                    raise ValueError(f'{file_path} was written by a newer raw store version: {raw_data[1]}')
+                codec = RawRecordCodec(raw_data[2])
+            elif isinstance(raw_data, list):
+                yield from (RawApplication(**record) for record in raw_data)
+            else:
+                yield RawApplication(**raw_data)
@@ -0,0 +1,95 @@
+import sys
+
+# Placeholder values of fields that weren't found or couldn't be extracted. Interned, so every record shares one object
+# and they can be compared by identity.
+NOT_FOUND = sys.intern('None')
+EXTRACTION_ERROR = sys.intern('EXTRACTION_ERROR')
+
+
+class Record:
+    """
+    Base of the slotted records passed between the crawler, parser and writers. A subclass declares its fields in
+    `__slots__` and their defaults in `defaults`. Slots starting with an underscore are private and not fields.
+    Records cost a fraction of the memory of a dictionary and are created without copying a template. Fields are set
+    as attributes, and records can also be read like a read-only dictionary, so code reading dictionaries keeps working.
+    """
+    __slots__ = ()
+    _fields = ()
+    defaults = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(field for klass in reversed(cls.__mro__) for field in vars(klass).get('__slots__', ())
+                            if not field.startswith('_'))
+
+    def __init__(self, **values):
+        for field in self._fields:
+            setattr(self, field, values.pop(field, self.defaults.get(field)))
+
+        if values:
+            raise TypeError(f'Unknown fields for {self.__class__.__name__}: {", ".join(values)}')
+
+    @classmethod
+    def fields(cls) -> tuple:
+        return cls._fields
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def as_row(self, fields=None) -> dict:
+        """
+        :param fields: Fields to include, in order. None includes every field.
+        :return: Returns the record as a dictionary, e.g. for an output writer.
+        """
+        return {field: getattr(self, field) for field in fields or self._fields}
+
+    def keys(self):
+        return iter(self._fields)
+
+    def values(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def items(self):
+        return ((field, getattr(self, field)) for field in self._fields)
+
+    def get(self, field: str, default=None):
+        return getattr(self, field) if field in self._fields else default
+
+    def __getitem__(self, field: str):
+        if field not in self._fields:
+            raise KeyError(field)
+
+        return getattr(self, field)
+
+    def __contains__(self, field: str):
+        return field in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.as_tuple() == self.as_tuple()
+
+    def __repr__(self):
+        values = ', '.join(f'{field}={getattr(self, field)!r:.60}' for field in self._fields)
+        return f'{self.__class__.__name__}({values})'
+
+
+class RawApplication(Record):
+    """
+    Pages the crawler fetched for one application: the raw record handed to the parser.
+    """
+    __slots__ = ('main_details_data', 'dates_data', 'document_data', 'source')
+
+
+class PlanningApplication(Record):
+    """
+    Parsed planning application: the output schema of every parsing strategy.
+    """
+    __slots__ = ('council_decision', 'application_number', 'application_type', 'site_address', 'proposal',
+                 'appeal_submitted', 'appeal_decision', 'appeal_date_lodged', 'appeal_decision_date', 'received',
+                 'registered', 'decision_expiry', 'easting', 'northing', 'planning_portal_reference', 'source')
+    defaults = {**dict.fromkeys(__slots__, NOT_FOUND), 'source': None}
@@ -0,0 +1,53 @@
+import importlib
+import json
+import os
+import threading
+
+MAP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'map.json')
+
+
+class StrategyRegistry:
+    """
+    Resolves a website to its crawling and parsing strategies. `map.json` is read once, and a strategy module is only
+    imported the first time that strategy is asked for, so a run never imports the dependencies of stages it skips.
+    """
+
+    def __init__(self, map_file: str = MAP_FILE):
+        self.map_file = map_file
+        self._mapping = None
+        self._strategies = {}
+        self._lock = threading.Lock()
+
+    @property
+    def mapping(self) -> dict:
+        if self._mapping is None:
+            with open(self.map_file, 'r') as file:
+                self._mapping = json.load(file)
+
+        return self._mapping
+
+    def get_websites(self) -> list:
+        return list(self.mapping)
+
+    def get_crawling_strategy(self, website_name: str):
+        return self._get_strategy(website_name, 'crawler', 'CrawlingStrategy')
+
+    def get_parsing_strategy(self, website_name: str):
+        return self._get_strategy(website_name, 'parser', 'ParsingStrategy')
+
+    def _get_strategy(self, website_name: str, package: str, suffix: str):
+        key = (website_name, package)
+        with self._lock:
+            if key not in self._strategies:
+                if website_name not in self.mapping:
+                    raise KeyError(f'No strategies registered for {website_name} in {self.map_file}')
+
+                file_name = self.mapping[website_name]
+                module = importlib.import_module(f'{package}.{file_name}')
+                class_name = f"{''.join([element.capitalize() for element in file_name.split('_')])}{suffix}"
+                self._strategies[key] = getattr(module, class_name)
+
+        return self._strategies[key]
+
+
+registry = StrategyRegistry()
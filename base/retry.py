@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from requests.exceptions import ChunkedEncodingError, ConnectionError, HTTPError, Timeout
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of sending a request to a host whose circuit breaker is open.
+    """
+    pass
+
+
+class RetryPolicy:
+    """
+    Decides which failed requests are worth retrying and how long to wait before doing so: capped exponential backoff
+    with full jitter, unless the server asked for a specific delay with *Retry-After*.
+    """
+    retry_statuses = frozenset({429, 500, 502, 503, 504})
+    retry_exceptions = (ConnectionError, Timeout, ChunkedEncodingError)
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 max_retry_after: float = 300.0):
+        """
+        :param max_attempts: Total number of attempts, including the first one.
+        :param base_delay: Backoff delay in seconds before the first retry, doubled on every attempt.
+        :param max_delay: Upper bound in seconds of the backoff delay.
+        :param max_retry_after: Upper bound in seconds of a delay requested by the server.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, exception: Exception) -> bool:
+        if isinstance(exception, CircuitOpenError):
+            return False
+
+        if isinstance(exception, HTTPError):
+            return exception.response is not None and exception.response.status_code in self.retry_statuses
+
+        return isinstance(exception, self.retry_exceptions)
+
+    @staticmethod
+    def is_host_failure(exception: Exception) -> bool:
+        """
+        :return: Returns True if the failure suggests the host itself is unhealthy. Client errors and throttling
+        *(429)* don't count, since the host is up and answering.
+        """
+        if isinstance(exception, HTTPError):
+            return exception.response is not None and exception.response.status_code >= 500
+
+        return isinstance(exception, (ConnectionError, Timeout))
+
+    def get_delay(self, attempt: int, exception: Exception) -> float:
+        """
+        :param attempt: Number of attempts made so far.
+        :param exception: The exception raised by the last attempt.
+        :return: Returns the number of seconds to wait before the next attempt.
+        """
+        response = getattr(exception, 'response', None)
+        retry_after = self.get_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def get_retry_after(response):
+        """
+        :return: Returns the delay in seconds requested by a *Retry-After* header, or None if there isn't a valid one.
+        """
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after:
+            return None
+
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """
+    Fails fast for a host after `failure_threshold` consecutive host failures. After `reset_timeout` seconds, a single
+    probe request is let through: success closes the circuit again, another failure keeps it open.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self._failure_count = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self, host: str = None):
+        """
+        :raises CircuitOpenError: If the circuit is open, or half-open with its probe request already in flight.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+
+            raise CircuitOpenError(f'Circuit open for {host or "host"}, failing fast')
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failure_count = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failure_count += 1
+            if self.state == self.HALF_OPEN or self._failure_count >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class FairLimiter:
+    """
+    Global cap on the requests in flight across every website. While the cap is reached, freed slots are handed to the
+    waiting websites in turn, so a website with many waiting requests can't starve the others.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._in_flight = 0
+        # Website -> events of its waiting requests, in the order websites take turns.
+        self._waiting = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, website: str):
+        with self._lock:
+            if self._in_flight < self.max_workers and not self._waiting:
+                self._in_flight += 1
+                return
+
+            event = threading.Event()
+            self._waiting.setdefault(website, deque()).append(event)
+
+        event.wait()
+
+    def release(self):
+        with self._lock:
+            if not self._waiting:
+                self._in_flight -= 1
+                return
+
+            # The slot passes straight to the next website's oldest request, which then goes to the back of the line.
+            website, events = next(iter(self._waiting.items()))
+            event = events.popleft()
+            if events:
+                self._waiting.move_to_end(website)
+            else:
+                del self._waiting[website]
+
+        event.set()
+
+
+class SiteLimiter:
+    """
+    Budget of a single website: at most `max_concurrency` requests in flight, started at least `min_interval` seconds
+    apart, each holding a slot of the global `FairLimiter`.
+    """
+
+    def __init__(self, website: str, fair_limiter: FairLimiter, max_concurrency: int, min_interval: float = 0.0):
+        self.website = website
+        self.fair_limiter = fair_limiter
+        self.min_interval = min_interval
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_for_turn(self):
+        if not self.min_interval:
+            return
+
+        # Each request reserves the next start time, so concurrent requests queue up instead of all waking at once.
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+
+        if start > now:
+            time.sleep(start - now)
+
+    @contextmanager
+    def slot(self):
+        with self._semaphore:
+            # Politeness delays are waited out before taking a global slot, so they don't hold one up.
+            self._wait_for_turn()
+            self.fair_limiter.acquire(self.website)
+            try:
+                yield
+            finally:
+                self.fair_limiter.release()
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to a server with AIMD *(additive increase, multiplicative decrease)*. Every healthy
+    response, i.e. one whose latency stays within `latency_tolerance` times the baseline latency, raises the limit by
+    about one request per full window of requests. An overloaded response *(timeout, 429, 5xx)* multiplies it by
+    `decrease_factor`, at most once per window, so a burst of failures of requests already in flight counts as one.
+    The limit stays between `min_limit` and `max_limit`. Use the same value for both for a fixed limit.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: float = None, decrease_factor: float = 0.5,
+                 latency_tolerance: float = 2.0):
+        """
+        :param max_limit: Upper bound of the limit, e.g. the politeness limit configured for the host.
+        :param min_limit: Lower bound of the limit.
+        :param initial_limit: Limit to start at. Defaults to half of `max_limit`.
+        :param decrease_factor: Factor the limit is multiplied by on overload.
+        :param latency_tolerance: Multiple of the baseline latency up to which a response counts as healthy.
+        """
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max(self.min_limit, min(max_limit, initial_limit or max_limit / 2)))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.baseline_latency = None
+        self._in_flight = 0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        :return: Returns the time the request started at, to pass to `release()`.
+        """
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+        return time.monotonic()
+
+    def release(self, started_at: float, latency: float = None, is_overloaded: bool = False) -> bool:
+        """
+        :param started_at: Value returned by `acquire()`.
+        :param latency: Seconds the server took to respond. None if it didn't *(e.g. the connection failed)*.
+        :param is_overloaded: True if the response showed the server is overloaded.
+        :return: Returns True if the limit was decreased.
+        """
+        is_decreased = False
+        with self._condition:
+            is_saturated = self._in_flight >= int(self.limit)
+            self._in_flight -= 1
+
+            if is_overloaded:
+                # Requests sent before the last decrease were sent at the old limit and don't decrease it again.
+                if started_at > self._decreased_at:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._decreased_at = time.monotonic()
+                    is_decreased = True
+            elif latency is not None:
+                # The baseline follows the fastest responses, but creeps up so a server that got slower for good
+                # isn't held to latencies it can no longer reach.
+                if self.baseline_latency is None or latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    self.baseline_latency += (latency - self.baseline_latency) * 0.01
+
+                # Only a limit that was reached is raised, otherwise it would grow without ever being tested.
+                if is_saturated and latency <= self.baseline_latency * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
+
+        return is_decreased
+
+
+class Scheduler:
+    """
+    Runs the pipelines of several websites concurrently in one process. Each website gets its own thread and
+    `SiteLimiter`, and all of them share one global request cap.
+    """
+
+    def __init__(self, max_workers: int = 16):
+        """
+        :param max_workers: Maximum number of requests in flight across every website.
+        """
+        self.fair_limiter = FairLimiter(max_workers)
+
+    def get_site_limiter(self, website: str, max_concurrency: int, min_interval: float = 0.0) -> SiteLimiter:
+        return SiteLimiter(website, self.fair_limiter, max_concurrency, min_interval)
+
+    def run(self, websites: list, run_website) -> dict:
+        """
+        :param websites: Websites to run.
+        :param run_website: Function called with each website on its own thread.
+        :return: Returns a dictionary mapping each website to its result, or to the exception it raised. A failing
+        website doesn't stop the others.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(websites) or 1, thread_name_prefix='website') as executor:
+            futures = {website: executor.submit(run_website, website) for website in websites}
+            for website, future in futures.items():
+                try:
+                    results[website] = future.result()
+                except Exception as e:
+                    results[website] = e
+
+        return results
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class CrawlState:
+    """
+    Local store of the applications seen by previous runs, with a fingerprint of their search result row and of their
+    main details page. Incremental crawls use it to stop paginating early and to skip unchanged applications.
+    """
+
+    def __init__(self, file_path: str = 'output/crawl_state.sqlite'):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS applications ('
+                                 'reference TEXT PRIMARY KEY, listing_fingerprint TEXT, details_fingerprint TEXT, '
+                                 'updated_at REAL)')
+        self._connection.commit()
+
+    def get(self, reference: str):
+        """
+        :param reference: Application reference *(its URL)*.
+        :return: Returns a (listing_fingerprint, details_fingerprint) tuple, or None for an unseen application.
+        """
+        with self._lock:
+            return self._connection.execute('SELECT listing_fingerprint, details_fingerprint FROM applications '
+                                            'WHERE reference = ?', (reference,)).fetchone()
+
+    def is_listing_unchanged(self, reference: str, listing_fingerprint: str) -> bool:
+        fingerprints = self.get(reference)
+        return bool(fingerprints) and fingerprints[0] == listing_fingerprint
+
+    def is_unchanged(self, reference: str, listing_fingerprint: str, details_fingerprint: str) -> bool:
+        return self.get(reference) == (listing_fingerprint, details_fingerprint)
+
+    def update(self, reference: str, listing_fingerprint: str, details_fingerprint: str):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO applications VALUES (?, ?, ?, ?)',
+                                     (reference, listing_fingerprint, details_fingerprint, time.time()))
+            self._connection.commit()
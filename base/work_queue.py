@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """
+    Queue of application URLs shared by a coordinator and any number of worker processes, through one SQLite file.
+    Workers lease items for a limited time and ack them with their parsed result. An item whose lease runs out, e.g.
+    because its worker died, goes back to the queue and is retried, up to `max_attempts` times.
+    """
+
+    def __init__(self, file_path: str = 'output/work_queue.sqlite', max_attempts: int = 3):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit, so leases can take the write lock up front with BEGIN IMMEDIATE. Other processes wait for it.
+        self._connection = sqlite3.connect(file_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS items ('
+                                 'id INTEGER PRIMARY KEY, website TEXT, url TEXT, state TEXT, attempts INTEGER, '
+                                 'worker TEXT, lease_expires_at REAL, result TEXT, error TEXT, updated_at REAL, '
+                                 'UNIQUE (website, url))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS items_state ON items (website, state)')
+
+    def _transaction(self, statements):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self._connection)
+                self._connection.execute('COMMIT')
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+
+        return result
+
+    def enqueue(self, website: str, urls) -> int:
+        """
+        :param website: Website key the URLs belong to.
+        :param urls: Application URLs. URLs already queued for the website are ignored.
+        :return: Returns the number of URLs added.
+        """
+        now = time.time()
+
+        def insert(connection):
+            cursor = connection.executemany('INSERT OR IGNORE INTO items (website, url, state, attempts, updated_at) '
+                                            'VALUES (?, ?, ?, 0, ?)', ((website, url, PENDING, now) for url in urls))
+            return cursor.rowcount
+
+        return self._transaction(insert)
+
+    def lease(self, websites: list, worker: str, lease_seconds: float = 300.0, count: int = 1) -> list:
+        """
+        :param websites: Websites the worker can handle.
+        :param worker: Worker ID the items are leased to.
+        :param lease_seconds: Seconds the worker has to ack or fail an item before it's handed to another worker.
+        :param count: Maximum number of items to lease.
+        :return: Returns a list of (item_id, website, url) tuples, oldest first. Empty when nothing is available.
+        """
+        now = time.time()
+        placeholders = ', '.join('?' * len(websites))
+
+        def lease_items(connection):
+            # Leases that ran out and have no attempts left are given up on rather than retried forever.
+            connection.execute(f'UPDATE items SET state = ?, error = ?, updated_at = ? WHERE state = ? '
+                               f'AND lease_expires_at < ? AND attempts >= ? AND website IN ({placeholders})',
+                               (FAILED, 'Lease expired', now, LEASED, now, self.max_attempts, *websites))
+            items = connection.execute(f'SELECT id, website, url FROM items WHERE website IN ({placeholders}) '
+                                       f'AND (state = ? OR (state = ? AND lease_expires_at < ?)) ORDER BY id LIMIT ?',
+                                       (*websites, PENDING, LEASED, now, count)).fetchall()
+            connection.executemany('UPDATE items SET state = ?, attempts = attempts + 1, worker = ?, '
+                                   'lease_expires_at = ?, updated_at = ? WHERE id = ?',
+                                   ((LEASED, worker, now + lease_seconds, now, item[0]) for item in items))
+            return items
+
+        return self._transaction(lease_items)
+
+    def ack(self, item_id: int, worker: str, result: dict = None) -> bool:
+        """
+        :param item_id: Leased item.
+        :param worker: Worker ID that leased it.
+        :param result: Parsed record to store with the item. None if the application produced no record.
+        :return: Returns False if the lease had already been given to another worker, in which case it's not acked.
+        """
+        result = None if result is None else json.dumps(dict(result), default=str)
+
+        def update(connection):
+            return connection.execute('UPDATE items SET state = ?, result = ?, error = NULL, updated_at = ? '
+                                      'WHERE id = ? AND state = ? AND worker = ?',
+                                      (DONE, result, time.time(), item_id, LEASED, worker)).rowcount == 1
+
+        return self._transaction(update)
+
+    def fail(self, item_id: int, worker: str, error: str) -> bool:
+        """
+        Hands a leased item back to the queue, or marks it failed once it has used up `max_attempts`.
+        :return: Returns False if the lease had already been given to another worker.
+        """
+        def update(connection):
+            return connection.execute('UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                                      'error = ?, lease_expires_at = NULL, updated_at = ? '
+                                      'WHERE id = ? AND state = ? AND worker = ?',
+                                      (self.max_attempts, FAILED, PENDING, error, time.time(), item_id, LEASED,
+                                       worker)).rowcount == 1
+
+        return self._transaction(update)
+
+    def get_counts(self, website: str = None) -> dict:
+        """
+        :return: Returns the number of items in each state.
+        """
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        with self._lock:
+            if website:
+                rows = self._connection.execute('SELECT state, COUNT(*) FROM items WHERE website = ? GROUP BY state',
+                                                (website,))
+            else:
+                rows = self._connection.execute('SELECT state, COUNT(*) FROM items GROUP BY state')
+            counts.update(rows)
+
+        return counts
+
+    def is_drained(self, websites: list) -> bool:
+        """
+        :return: Returns True once no item of the websites is pending or leased.
+        """
+        placeholders = ', '.join('?' * len(websites))
+        with self._lock:
+            row = self._connection.execute(f'SELECT COUNT(*) FROM items WHERE website IN ({placeholders}) '
+                                           f'AND state IN (?, ?)', (*websites, PENDING, LEASED)).fetchone()
+
+        return row[0] == 0
+
+    def get_results(self, website: str, batch_size: int = 1000):
+        """
+        :return: Yields the parsed records of the website's acked items in the order they were queued. They are read
+        in batches, so the results are never all in memory.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute('SELECT id, result FROM items WHERE website = ? AND state = ? '
+                                                'AND result IS NOT NULL AND id > ? ORDER BY id LIMIT ?',
+                                                (website, DONE, last_id, batch_size)).fetchall()
+            if not rows:
+                break
+
+            for last_id, result in rows:
+                yield json.loads(result)
@@ -0,0 +1,243 @@
+import csv
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+from base.records import Record
+
+
+class OutputWriter(ABC):
+    """
+    Streaming writer for parsed records. Rows are written as they arrive, so nothing holds the whole output in memory.
+    """
+    extension = None
+
+    def __init__(self, file_path: str, mode: str = 'w', fields: list = None):
+        """
+        :param file_path: File to write.
+        :param mode: 'w' to overwrite the file, 'a' to append to it.
+        :param fields: Fields to write, in order. None writes every field.
+        """
+        if mode not in ('w', 'a'):
+            raise ValueError(f'Unsupported output mode: {mode}')
+
+        self.file_path = file_path
+        self.mode = mode
+        self.fields = fields
+        self.row_count = 0
+
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_row(self, data) -> dict:
+        """
+        :param data: Parsed record, either a `Record` or a dictionary *(e.g. a work queue result)*.
+        :return: Returns the record as a dictionary of the output fields.
+        """
+        if isinstance(data, Record):
+            return data.as_row(self.fields)
+
+        return {field: data[field] for field in self.fields} if self.fields else data
+
+    @abstractmethod
+    def write(self, data: dict):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def write_all(self, data_iter) -> int:
+        """
+        :param data_iter: Iterable of parsed records.
+        :return: Returns the number of rows written.
+        """
+        for data in data_iter:
+            self.write(data)
+
+        return self.row_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvWriter(OutputWriter):
+    extension = 'csv'
+
+    def __init__(self, file_path: str, mode: str = 'w', fields: list = None):
+        super().__init__(file_path, mode, fields)
+        write_header = mode == 'w' or not os.path.exists(file_path) or not os.path.getsize(file_path)
+        self._file = open(file_path, mode, newline='', encoding='utf-8')
+        self._writer = None
+        self._write_header = write_header
+
+    def write(self, data: dict):
+        data = self.get_row(data)
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(data), lineterminator='\n')
+            if self._write_header:
+                self._writer.writeheader()
+
+        self._writer.writerow(data)
+        self.row_count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesWriter(OutputWriter):
+    extension = 'jsonl'
+
+    def __init__(self, file_path: str, mode: str = 'w', fields: list = None):
+        super().__init__(file_path, mode, fields)
+        self._file = open(file_path, mode, encoding='utf-8')
+
+    def write(self, data: dict):
+        self._file.write(json.dumps(self.get_row(data), ensure_ascii=False))
+        self._file.write('\n')
+        self.row_count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter(OutputWriter):
+    """
+    Writes row groups of `batch_size` rows with pyarrow, which is only needed when this writer is used. Parquet files
+    can't be appended to, so append mode writes a new numbered part file next to the existing ones.
+    """
+    extension = 'parquet'
+    batch_size = 10000
+
+    def __init__(self, file_path: str, mode: str = 'w', fields: list = None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('Parquet output requires pyarrow: pip install pyarrow')
+
+        if mode == 'a' and os.path.exists(file_path):
+            file_path = self._get_part_path(file_path)
+
+        super().__init__(file_path, mode, fields)
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self._writer = None
+        self._rows = []
+
+    @staticmethod
+    def _get_part_path(file_path: str) -> str:
+        root, extension = os.path.splitext(file_path)
+        part = 1
+        while os.path.exists(f'{root}.part{part}{extension}'):
+            part += 1
+
+        return f'{root}.part{part}{extension}'
+
+    def write(self, data: dict):
+        self._rows.append(self.get_row(data))
+        self.row_count += 1
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+
+        table = self._pyarrow.Table.from_pylist(self._rows)
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self.file_path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {writer.extension: writer for writer in (CsvWriter, JsonLinesWriter, ParquetWriter)}
+
+
+class PartitionedWriter(OutputWriter):
+    """
+    Splits rows into `<directory>/<field>=<value>/part.<extension>` files by the value of one field. Date values in the
+    council's dd/mm/yyyy format are partitioned by `date_format` *(one directory per month by default)*. Only the most
+    recently used partitions are kept open. The others are closed and reopened in append mode if they get more rows.
+    """
+    max_open_partitions = 32
+
+    def __init__(self, directory: str, writer_class, partition_by: str, mode: str = 'w', date_format: str = '%Y-%m',
+                 fields: list = None):
+        """
+        :param directory: Root directory of the partitions.
+        :param writer_class: OutputWriter subclass used for each partition.
+        :param partition_by: Field whose value picks the partition.
+        :param mode: 'w' to overwrite partitions written by an earlier run, 'a' to append to them.
+        :param date_format: strftime format of date partition values.
+        :param fields: Fields to write, in order. None writes every field. The partition field doesn't need to be one.
+        """
+        super().__init__(os.path.join(directory, ''), mode, fields)
+        self.directory = directory
+        self.writer_class = writer_class
+        self.partition_by = partition_by
+        self.date_format = date_format
+        self._writers = OrderedDict()
+        self._opened_partitions = set()
+
+    def get_partition(self, data: dict) -> str:
+        value = str(data.get(self.partition_by) or '').strip()
+        try:
+            value = datetime.strptime(value, '%d/%m/%Y').strftime(self.date_format)
+        except ValueError:
+            value = re.sub(r'[^\w.-]+', '_', value) or 'unknown'
+
+        return f'{self.partition_by}={value}'
+
+    def write(self, data: dict):
+        partition = self.get_partition(data)
+        writer = self._writers.pop(partition, None)
+        if writer is None:
+            # Partitions seen earlier in this run are always appended to, so closing them doesn't lose rows.
+            mode = 'a' if partition in self._opened_partitions else self.mode
+            file_path = os.path.join(self.directory, partition, f'part.{self.writer_class.extension}')
+            writer = self.writer_class(file_path, mode=mode, fields=self.fields)
+            self._opened_partitions.add(partition)
+
+            if len(self._writers) >= self.max_open_partitions:
+                self._writers.popitem(last=False)[1].close()
+
+        self._writers[partition] = writer
+        writer.write(data)
+        self.row_count += 1
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def get_writer(output_format: str, file_path: str, mode: str = 'w', partition_by: str = None,
+               fields: list = None) -> OutputWriter:
+    """
+    :param output_format: One of 'csv', 'jsonl' or 'parquet'.
+    :param file_path: Output file, or the root directory of the partitions when `partition_by` is given.
+    :param mode: 'w' to overwrite, 'a' to append.
+    :param partition_by: Field to partition the output by, e.g. 'received'.
+    :param fields: Fields to write, in order. None writes every field.
+    :return: Returns an OutputWriter to be used as a context manager.
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f'Unsupported output format: {output_format}')
+
+    if partition_by:
+        return PartitionedWriter(file_path, WRITERS[output_format], partition_by, mode=mode, fields=fields)
+
+    return WRITERS[output_format](file_path, mode=mode, fields=fields)
@@ -0,0 +1,174 @@
+"""
+Synthetic Wandsworth planning corpus for offline benchmarks. Pages reproduce the parts of the Northgate Planning
+Explorer markup the crawler and parser rely on *(hidden ASP.NET form state, result tables, label spans, document
+postbacks)*, padded with a realistic amount of viewstate and page chrome.
+"""
+import base64
+import random
+from datetime import datetime, timedelta
+from urllib.parse import quote, quote_plus
+
+RESULTS_PER_PAGE = 10
+DETAILS_QUERY = 'PT=Planning%20Applications%20On-Line&TYPE=PL/PlanningPK.xml&PARAM0={pk}' \
+                '&XSLT=/Northgate/PlanningExplorer/SiteFiles/Skins/Wandsworth/xslt/PL/PLDetails.xslt' \
+                '&FT=Planning%20Application%20Details&PUBLIC=Y&DAURI=PLANNING'
+DATES_QUERY = 'PT=Planning%20Applications%20On-Line&TYPE=PL/PlanningPK.xml&PARAM0={pk}' \
+              '&XSLT=/Northgate/PlanningExplorer/SiteFiles/Skins/Wandsworth/xslt/PL/PLDates.xslt' \
+              '&FT=Planning%20Application%20Dates&PUBLIC=Y&DAURI=PLANNING'
+
+PAGE_CHROME = ''.join(f'<li class="menu"><a href="/Northgate/PlanningExplorer/Menu{i}.aspx"><span>Menu item {i}</span>'
+                      f'</a></li>' for i in range(60))
+
+
+class Application:
+    def __init__(self, pk: int, received: datetime, rng: random.Random):
+        self.pk = pk
+        self.number = f'{received.year}/{1000 + pk}'
+        self.received = received
+        self.registered = received + timedelta(days=rng.randint(1, 10))
+        self.decision_expiry = self.registered + timedelta(days=56)
+        self.address = f'{rng.randint(1, 300)} {rng.choice(["High", "Church", "Mill", "Park"])} Street, London SW18'
+        self.application_type = rng.choice(['Full Planning', 'Householder', 'Listed Building Consent'])
+        self.proposal = 'Erection of a single storey rear extension ' * rng.randint(1, 4)
+        self.decision = rng.choice([None, f'Granted {self.decision_expiry.strftime("%d/%m/%Y")}',
+                                    f'Refused {self.decision_expiry.strftime("%d/%m/%Y")}'])
+        self.has_document = rng.random() < 0.8
+        self.easting = rng.randint(520000, 530000)
+        self.northing = rng.randint(170000, 180000)
+        self.portal_reference = f'PP-{rng.randint(1000000, 9999999)}'
+
+
+def build_applications(count: int, search_days: int = 6 * 30, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    applications = [Application(pk, today - timedelta(days=rng.randint(0, search_days)), rng) for pk in range(count)]
+
+    return sorted(applications, key=lambda application: application.received, reverse=True)
+
+
+def hidden_form_state(rng_seed: int, viewstate_size: int = 30000) -> str:
+    viewstate = base64.b64encode(random.Random(rng_seed).randbytes(viewstate_size * 3 // 4)).decode()
+    return (f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />'
+            f'<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="7C5A5B3D" />'
+            f'<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{viewstate[:2000]}" />')
+
+
+def page(title: str, body: str, rng_seed: int = 0) -> str:
+    return (f'<!DOCTYPE html><html><head><title>{title}</title></head><body><form method="post">'
+            f'{hidden_form_state(rng_seed)}<ul class="nav">{PAGE_CHROME}</ul>{body}</form></body></html>')
+
+
+def search_form_page() -> str:
+    return page('General Search', '<input name="txtApplicationNumber" /><input type="submit" name="csbtnSearch" />')
+
+
+def results_page(applications: list, page_number: int, next_query: str = None) -> str:
+    start = (page_number - 1) * RESULTS_PER_PAGE
+    rows = ''.join(f'<tr><td class="TableData"><a class="data_text" href="StdDetails.aspx?'
+                   f'{DETAILS_QUERY.format(pk=application.pk)}">{application.number}</a></td>'
+                   f'<td class="TableData">{application.address}</td>'
+                   f'<td class="TableData">{application.decision or "Pending Consideration"}</td></tr>'
+                   for application in applications[start:start + RESULTS_PER_PAGE])
+    next_link = '' if not next_query else \
+        f'<a class="noborder" href="StdResults.aspx?{next_query}"><img title="Go to next page " /></a>'
+
+    return page('Search Results', f'<table class="display_table">{rows}</table>{next_link}', page_number)
+
+
+def labelled(label: str, value: str) -> str:
+    return f'<li><div><span>{label}</span>\n{value}</div></li>'
+
+
+def details_page(application: Application) -> str:
+    documents_url = f'https://planning2.wandsworth.gov.uk/planningcase/comments.aspx?case={quote(application.number)}'
+    body = ('<ul class="details">'
+            + labelled('Application Number', application.number)
+            + labelled('Site Address', application.address)
+            + labelled('Application Type', application.application_type)
+            + labelled('Proposal', application.proposal)
+            + labelled('Decision', application.decision or '')
+            + labelled('Appeal Submitted?', 'No')
+            + labelled('Appeal Lodged', '')
+            + '</ul>'
+            f'<a title="Link to the application Dates page." href="StdDetails.aspx?'
+            f'{DATES_QUERY.format(pk=application.pk)}">Dates</a>'
+            f'<a title="Link to View Related Documents" href="{documents_url}">Documents</a>')
+
+    return page('Planning Application Details', body, application.pk)
+
+
+def dates_page(application: Application) -> str:
+    body = ('<ul class="dates">'
+            + labelled('Received?', application.received.strftime('%d/%m/%Y'))
+            + labelled('Registered', application.registered.strftime('%d/%m/%Y'))
+            + labelled('Decision Expiry', application.decision_expiry.strftime('%d/%m/%Y'))
+            + '</ul>')
+
+    return page('Planning Application Dates', body, application.pk)
+
+
+def documents_page(application: Application) -> str:
+    rows = '<tr><td><span>Site Plan</span></td><td><a href="javascript:__doPostBack(\'gvDocs$ctl03$lnkDShow\',\'\')">' \
+           'View</a></td></tr>'
+    if application.has_document:
+        rows += '<tr><td><span>Application Form</span></td><td><a href="javascript:__doPostBack(' \
+                '\'gvDocs$ctl02$lnkDShow\',\'\')">View</a></td></tr>'
+
+    body = f'<span id="lblCaseNo">{application.number}</span><table id="gvDocs">{rows}</table>'
+    return page('Related Documents', body, application.pk)
+
+
+def document_links_page(application: Application) -> str:
+    pdf_url = f'https://planning2.wandsworth.gov.uk/documents/{application.pk}/application_form.pdf'
+    body = (f'<a target="_blank" href="https://planning2.wandsworth.gov.uk/documents/{application.pk}/plans.html">'
+            f'Plans</a><table><tr><td>Application Form</td><td><a target="_blank" href="{pdf_url}">View</a></td></tr>'
+            f'</table>')
+
+    return page('Related Documents', body, application.pk)
+
+
+def application_form_pdf(application: Application, filler_pages: int = 8) -> bytes:
+    pages = [
+        ['Application for Planning Permission', f'Planning Portal Reference: {application.portal_reference}'],
+        ['Site Location', f'Easting (x) {application.easting}Northing (y) {application.northing}'],
+    ]
+    pages += [[f'Supporting statement line {line}' for line in range(40)] for _ in range(filler_pages)]
+
+    return build_pdf(pages)
+
+
+def build_pdf(pages: list) -> bytes:
+    """
+    :param pages: List of pages, each a list of text lines.
+    :return: Returns a minimal, valid PDF with one Helvetica text line per entry.
+    """
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    kids = ' '.join(f'{4 + 2 * index} 0 R' for index in range(len(pages)))
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>',
+               f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>',
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    for index, lines in enumerate(pages):
+        stream = 'BT /F1 10 Tf 50 750 Td ' + ' '.join(f'({escape(line)}) Tj 0 -14 Td' for line in lines) + ' ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>')
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+
+    pdf = '%PDF-1.4\n'
+    offsets = []
+    for number, pdf_object in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f'{number} 0 obj\n{pdf_object}\nendobj\n'
+
+    xref_offset = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'
+    pdf += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets)
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'
+
+    return pdf.encode('latin-1')
+
+
+def next_results_query(page_number: int, date_start: str, date_end: str) -> str:
+    return f'PT=Planning%20Applications%20On-Line&PS={RESULTS_PER_PAGE}&p={page_number}' \
+           f'&ds={quote_plus(date_start)}&de={quote_plus(date_end)}'
@@ -0,0 +1,179 @@
+import argparse
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks import fixtures
+
+HOSTS = {
+    'planning': 'https://planning.wandsworth.gov.uk',
+    'planning2': 'https://planning2.wandsworth.gov.uk',
+}
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Wandsworth planning sites. Both hosts are served from one port under /planning and
+    /planning2, see `get_url_rewrites()`. Every response can be delayed by `latency` seconds *(plus up to `jitter`)*
+    and replaced by a 503 with probability `error_rate`.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), application_count: int = 200, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, seed: int = 1):
+        super().__init__(address, ReplayRequestHandler)
+        self.applications = fixtures.build_applications(application_count, seed=seed)
+        self.applications_by_pk = {application.pk: application for application in self.applications}
+        self.applications_by_number = {application.number: application for application in self.applications}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._pdfs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def get_url_rewrites(self) -> dict:
+        return {real_host: f'{self.base_url}/{prefix}' for prefix, real_host in HOSTS.items()}
+
+    def get_pdf(self, application) -> bytes:
+        with self._lock:
+            if application.pk not in self._pdfs:
+                self._pdfs[application.pk] = fixtures.application_form_pdf(application)
+
+            return self._pdfs[application.pk]
+
+    def get_window(self, date_start: str, date_end: str) -> list:
+        date_start = datetime.strptime(date_start, '%d/%m/%Y')
+        date_end = datetime.strptime(date_end, '%d/%m/%Y')
+
+        return [application for application in self.applications if date_start <= application.received <= date_end]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(None)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        self._handle(parse_qs(body, keep_blank_values=True))
+
+    def _handle(self, form):
+        server = self.server
+        with server._lock:
+            server.request_count += 1
+            fail = server.rng.random() < server.error_rate
+            delay = server.latency + server.rng.random() * server.jitter
+
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            return self._respond(503, b'Service Unavailable', 'text/plain')
+
+        url_parts = urlsplit(self.path)
+        prefix, _, path = url_parts.path.lstrip('/').partition('/')
+        query = {key: values[0] for key, values in parse_qs(url_parts.query).items()}
+        route = self._route(prefix, f'/{path}', query, form)
+        if route is None:
+            return self._respond(404, b'Not Found', 'text/plain')
+
+        body, content_type = route
+        self._respond(200, body if isinstance(body, bytes) else body.encode('utf-8'), content_type)
+
+    def _route(self, prefix: str, path: str, query: dict, form):
+        server = self.server
+        html = 'text/html; charset=utf-8'
+
+        if prefix == 'planning' and path == '/Northgate/PlanningExplorer/GeneralSearch.aspx':
+            if form is None:
+                return fixtures.search_form_page(), html
+
+            return self._results(form['dateStart'][0], form['dateEnd'][0], 1), html
+
+        if prefix == 'planning' and path == '/Northgate/PlanningExplorer/Generic/StdResults.aspx':
+            return self._results(query['ds'], query['de'], int(query['p'])), html
+
+        if prefix == 'planning' and path == '/Northgate/PlanningExplorer/Generic/StdDetails.aspx':
+            application = server.applications_by_pk.get(int(query.get('PARAM0', -1)))
+            if application is None:
+                return None
+            if 'PLDates' in query.get('XSLT', ''):
+                return fixtures.dates_page(application), html
+
+            return fixtures.details_page(application), html
+
+        if prefix == 'planning2' and path == '/planningcase/comments.aspx':
+            application = server.applications_by_number.get(unquote(query.get('case', '')))
+            if application is None:
+                return None
+            if form is None:
+                return fixtures.documents_page(application), html
+
+            return fixtures.document_links_page(application), html
+
+        if prefix == 'planning2' and path.startswith('/documents/'):
+            _, pk, file_name = path.rsplit('/', 2)
+            application = server.applications_by_pk.get(int(pk))
+            if application is None:
+                return None
+            if file_name.endswith('.pdf'):
+                return server.get_pdf(application), 'application/pdf'
+
+            return fixtures.page('Plans', '<p>Plans</p>'), html
+
+        return None
+
+    def _results(self, date_start: str, date_end: str, page_number: int) -> str:
+        applications = self.server.get_window(date_start, date_end)
+        has_next_page = page_number * fixtures.RESULTS_PER_PAGE < len(applications)
+        next_query = fixtures.next_results_query(page_number + 1, date_start, date_end) if has_next_page else None
+
+        return fixtures.results_page(applications, page_number, next_query)
+
+    def _respond(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        with self.server._lock:
+            self.server.bytes_sent += len(body)
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Serve the synthetic Wandsworth planning corpus.')
+    argument_parser.add_argument('--port', type=int, default=8800)
+    argument_parser.add_argument('--applications', type=int, default=200)
+    argument_parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response.')
+    argument_parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds per response.')
+    argument_parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered by 503.')
+    args = argument_parser.parse_args()
+
+    replay_server = ReplayServer(('127.0.0.1', args.port), application_count=args.applications, latency=args.latency,
+                                 jitter=args.jitter, error_rate=args.error_rate)
+    for real_host, local_url in replay_server.get_url_rewrites().items():
+        print(f'{real_host} -> {local_url}')
+    replay_server.serve_forever()
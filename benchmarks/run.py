@@ -0,0 +1,200 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.replay_server import ReplayServer
+
+
+def serve(options: dict, ready_queue, stop_event):
+    """
+    Runs the replay server in its own process, so its CPU and memory don't distort the crawler's numbers.
+    """
+    replay_server = ReplayServer(**options).start()
+    ready_queue.put(replay_server.get_url_rewrites())
+    stop_event.wait()
+    ready_queue.put({'requests': replay_server.request_count, 'bytes_sent': replay_server.bytes_sent})
+    replay_server.stop()
+
+
+def run_isolated(function, *args):
+    """
+    Runs a benchmark stage in a freshly spawned process. Peak RSS is a per-process high-water mark, so a stage sharing
+    a process with an earlier one would report that stage's peak too.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    # It's the peak of the whole process, which is why every stage runs in its own, see `run_isolated()`.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak_rss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def benchmark_crawl(url_rewrites: dict, raw_file: str, work_directory: str, max_workers: int,
+                    trace_memory: bool) -> dict:
+    from base.metrics import metrics
+    from base.raw_store import write_raw_records
+    from base.retry import RetryPolicy
+    from crawler.wandsworth_gov_uk import WandsworthGovUkCrawlingStrategy
+
+    crawler = WandsworthGovUkCrawlingStrategy(max_workers=max_workers, cache_directory=None,
+                                              document_directory=os.path.join(work_directory, 'documents'))
+    crawler.downloader.url_rewrites = url_rewrites
+    crawler.downloader.retry_policy = RetryPolicy(base_delay=0.01, max_delay=0.1)
+    metrics.reset()
+
+    if trace_memory:
+        tracemalloc.start()
+
+    start_time = time.perf_counter()
+    application_count = sum(1 for _ in write_raw_records(crawler.crawl(), raw_file))
+    elapsed = time.perf_counter() - start_time
+
+    result = {
+        'applications': application_count,
+        'seconds': round(elapsed, 3),
+        'applications_per_second': round(application_count / elapsed, 2) if elapsed else 0.0,
+        'stages_mean_ms': {histogram['labels']['stage']: round(histogram['mean'] * 1000, 3)
+                           for histogram in metrics.snapshot()['histograms']
+                           if histogram['name'] == 'crawl_stage_duration_seconds'},
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+    if trace_memory:
+        result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+
+    return result
+
+
+def benchmark_parse(raw_file: str, trace_memory: bool) -> dict:
+    from base.metrics import metrics
+    from base.raw_store import read_raw_records
+    from parser.wandsworth_gov_uk import WandsworthGovUkParsingStrategy
+
+    parser = WandsworthGovUkParsingStrategy()
+    # Field extractors record their own timings. Start from a clean slate so only this run is reported.
+    metrics.reset()
+
+    if trace_memory:
+        tracemalloc.start()
+
+    record_timings = []
+    for raw_data in read_raw_records(raw_file):
+        start_time = time.perf_counter()
+        parser.parse_record(raw_data)
+        record_timings.append(time.perf_counter() - start_time)
+
+    result = {
+        'records': len(record_timings),
+        'records_per_second': round(len(record_timings) / sum(record_timings), 2) if record_timings else 0.0,
+        'mean_ms': round(statistics.mean(record_timings) * 1000, 3) if record_timings else 0.0,
+        'p50_ms': round(percentile(record_timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(record_timings, 0.95) * 1000, 3),
+        'fields_mean_ms': {histogram['labels']['field']: round(histogram['mean'] * 1000, 3)
+                           for histogram in metrics.snapshot()['histograms']
+                           if histogram['name'] == 'parse_field_duration_seconds'},
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+    if trace_memory:
+        result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+
+    return result
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: Returns a message for every headline metric more than `tolerance` *(a share)* worse than the baseline.
+    """
+    checks = [
+        ('crawl', 'applications_per_second', True),
+        ('parse', 'records_per_second', True),
+        ('parse', 'p95_ms', False),
+    ]
+    regressions = []
+    for section, metric, higher_is_better in checks:
+        current = report.get(section, {}).get(metric)
+        previous = baseline.get(section, {}).get(metric)
+        if not current or not previous:
+            continue
+
+        change = (previous - current) / previous if higher_is_better else (current - previous) / previous
+        if change > tolerance:
+            regressions.append(f'{section}.{metric}: {previous} -> {current} ({change:.0%} worse)')
+
+    return regressions
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description='Offline crawl and parse benchmarks against the replay '
+                                                          'server.')
+    argument_parser.add_argument('--applications', type=int, default=200)
+    argument_parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every response.')
+    argument_parser.add_argument('--jitter', type=float, default=0.01)
+    argument_parser.add_argument('--error-rate', type=float, default=0.0)
+    argument_parser.add_argument('--max-workers', type=int, default=8)
+    argument_parser.add_argument('--trace-memory', action='store_true',
+                                 help='Also report the tracemalloc peak. Slows both stages down.')
+    argument_parser.add_argument('--save', help='Write the report to this JSON file.')
+    argument_parser.add_argument('--baseline', help='Fail if the report regresses against this JSON report.')
+    argument_parser.add_argument('--tolerance', type=float, default=0.25)
+    args = argument_parser.parse_args(argv)
+
+    server_options = {'application_count': args.applications, 'latency': args.latency, 'jitter': args.jitter,
+                      'error_rate': args.error_rate}
+    ready_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server_process = multiprocessing.Process(target=serve, args=(server_options, ready_queue, stop_event),
+                                             daemon=True)
+    server_process.start()
+    url_rewrites = ready_queue.get(timeout=30)
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        raw_file = os.path.join(work_directory, 'raw_data.pkl')
+        try:
+            crawl_result = run_isolated(benchmark_crawl, url_rewrites, raw_file, work_directory, args.max_workers,
+                                        args.trace_memory)
+        finally:
+            stop_event.set()
+            server_stats = ready_queue.get(timeout=30)
+            server_process.join(timeout=30)
+
+        crawl_result.update(server_stats)
+        parse_result = run_isolated(benchmark_parse, raw_file, args.trace_memory)
+
+    report = {'config': vars(args), 'crawl': crawl_result, 'parse': parse_result}
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        with open(args.save, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,15 @@
+import hashlib
+import html
 import re
+import threading
+import time
+import weakref
 
 from bs4 import BeautifulSoup
 
+INPUT_TAG_PATTERN = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r'([^\s=/>]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+
 
 def get_application_href(soup: BeautifulSoup, bs_selector: str) -> str:
     """
@@ -24,3 +32,79 @@ def clean_href(href: str) -> str:
     :return:
     """
     return re.sub(r'\s', '', href.replace(" ", "%20"))
+
+
+def get_fingerprint(text: str) -> str:
+    """
+    :param text: Text to fingerprint.
+    :return: Returns a hash of the text that ignores differences in whitespace.
+    """
+    return hashlib.sha1(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def get_hidden_fields(page: str) -> dict:
+    """
+    Reads the hidden form fields of a page, e.g. the ASP.NET `__VIEWSTATE`, with a regex scan of its input tags rather
+    than by building a tree of the whole page.
+    :param page: HTML page.
+    :return: Returns a dictionary mapping each hidden field's name *(or id)* to its unescaped value.
+    """
+    hidden_fields = {}
+    for input_match in INPUT_TAG_PATTERN.finditer(page):
+        attributes = {}
+        for name, double_quoted, single_quoted, unquoted in ATTRIBUTE_PATTERN.findall(input_match.group(0)):
+            attributes.setdefault(name.lower(), double_quoted or single_quoted or unquoted)
+
+        if attributes.get('type', '').lower() != 'hidden':
+            continue
+
+        name = attributes.get('name') or attributes.get('id')
+        if name:
+            hidden_fields.setdefault(name, html.unescape(attributes.get('value', '')))
+
+    return hidden_fields
+
+
+def get_request_headers(headers: dict, **overrides) -> dict:
+    """
+    :param headers: Shared default headers. They are never modified.
+    :param overrides: Headers to set for this request, with underscores standing for dashes *(e.g. `Content_Type`)*.
+    :return: Returns a new dictionary of headers for a single request.
+    """
+    request_headers = dict(headers)
+    request_headers.update({name.replace('_', '-'): value for name, value in overrides.items()})
+
+    return request_headers
+
+
+class FormStateCache:
+    """
+    Hidden form fields of a page, per server session, so the page needn't be downloaded again while its state is
+    still accepted. ASP.NET accepts a form's state again within the session that received it.
+    """
+
+    def __init__(self, ttl: float = 15 * 60):
+        """
+        :param ttl: Seconds a form state is reused for.
+        """
+        self.ttl = ttl
+        # Session -> {URL: (hidden fields, fetched at)}. Entries go away with their session.
+        self._form_states = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, session, url: str):
+        """
+        :return: Returns the cached hidden fields of the page, or None if there are none or they're too old.
+        """
+        with self._lock:
+            hidden_fields, fetched_at = self._form_states.get(session, {}).get(url, (None, 0.0))
+
+        return hidden_fields if time.monotonic() - fetched_at < self.ttl else None
+
+    def put(self, session, url: str, hidden_fields: dict):
+        with self._lock:
+            self._form_states.setdefault(session, {})[url] = (hidden_fields, time.monotonic())
+
+    def invalidate(self, session, url: str):
+        with self._lock:
+            self._form_states.get(session, {}).pop(url, None)
@@ -1,18 +1,70 @@
+import copy
 import re
+import threading
 from datetime import datetime, timedelta
-from urllib.parse import urlencode, quote_plus
+from urllib.parse import urlencode, quote_plus, urlsplit
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 from base.crawler import CrawlingStrategy
+from base.cache import ResponseCache
+from base.document_store import DocumentStore
 from base.downloader import Downloader
-from base.logger import Logger
-from crawler.utils import clean_href, get_application_href
+from base.journal import CrawlJournal
+from base.logger import SAMPLED, Logger
+from base.metrics import metrics
+from base.records import RawApplication
+from base.state import CrawlState
+from crawler.utils import (FormStateCache, clean_href, get_application_href, get_fingerprint, get_hidden_fields,
+                           get_request_headers)
 
 
 class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
-    def __init__(self):
-        self.downloader = Downloader()
+    max_workers = 8  # Applications fetched at once
+    host_limits = {
+        'planning.wandsworth.gov.uk': 4,
+        'planning2.wandsworth.gov.uk': 2,
+    }
+    cache_ttl = 24 * 60 * 60  # Seconds before cached application pages and documents are revalidated
+    search_days = 6 * 30  # Days of received applications searched
+    shard_days = 7  # Days covered by each independently paginated search window
+    max_shard_workers = 4  # Search windows paginated at once
+    form_state_ttl = 15 * 60  # Seconds a session reuses the search form state for, instead of downloading the form
+
+    def __init__(self, max_workers: int = None, host_limits: dict = None, cache_directory: str = 'output/http_cache',
+                 state_file: str = None, shard_days: int = None, document_directory: str = 'output/documents',
+                 journal_file: str = None, pages: set = None):
+        """
+        :param max_workers: Number of applications to fetch concurrently. Use 1 to fetch them one at a time.
+        :param host_limits: Maximum in-flight requests per host, overriding the class defaults.
+        :param cache_directory: Directory of the HTTP response cache. Use None to always hit the network.
+        :param state_file: Crawl state file. When given, the crawl is incremental: pagination stops at the first page
+        of already known, unchanged applications and only new or changed applications are yielded.
+        :param shard_days: Days covered by each search window. Use more than `search_days` for a single search.
+        :param document_directory: Directory of the document store that PDFs are streamed to.
+        :param journal_file: Crawl journal file. When given, progress is checkpointed as it's made, and a crawl that
+        was interrupted resumes from its journal instead of starting over.
+        :param pages: Raw record pages to fetch, e.g. from `ParsingStrategy.get_required_pages()`. None fetches them
+        all. The main details page is always fetched, since the other pages are found through it. Incremental crawls
+        don't record the applications of a restricted crawl as seen.
+        """
+        self.max_workers = max_workers or self.max_workers
+        self.shard_days = shard_days or self.shard_days
+        self.state = CrawlState(state_file) if state_file else None
+        self.journal = CrawlJournal(journal_file) if journal_file else None
+        self.pages = pages
+        self._completed_urls = set()
+        self.form_states = FormStateCache(self.form_state_ttl)
+        self._is_form_state_reused = False
+        # Search shard of each search thread, so the windows a thread paginates in turn share its session.
+        self._shards = threading.local()
+        # Downloads that failed on each thread, to tell whether every page of an application was fetched.
+        self._download_failures = threading.local()
+        # Application URL -> (listing fingerprint, details fingerprint), saved once the record has been consumed.
+        self._fingerprints = {}
+        cache = ResponseCache(cache_directory) if cache_directory else None
+        self.downloader = Downloader(host_limits={**self.host_limits, **(host_limits or {})}, cache=cache)
+        self.document_store = DocumentStore(document_directory)
         self.logger = Logger(self.__class__.__name__).logger
         self.base_application_url = 'https://planning.wandsworth.gov.uk/Northgate/PlanningExplorer/Generic/'
         self.general_search_url = 'https://planning.wandsworth.gov.uk/Northgate/PlanningExplorer/GeneralSearch.aspx'
@@ -28,13 +80,16 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
             'Content-Type': 'application/x-www-form-urlencoded',
         }
 
-    def download(self, url, timeout=100, headers=None, cookies=None, data=None):
+    def download(self, url, timeout=100, headers=None, cookies=None, data=None, cache_ttl=None,
+                 stage='page'):
         """
         :param url: The URL to download content from.
         :param timeout: The timeout for the request in seconds.
         :param headers: Custom headers to be included in the request.
         :param cookies: Cookies to be included in the request.
         :param data: Data to be sent in the request body *(for POST requests)*.
+        :param cache_ttl: Seconds a cached response may be reused for. None always downloads.
+        :param stage: Crawl stage the download's duration is recorded under.
         :return: Returns downloaded content from the URL *(in bytes or string)*.
         """
         raw_data = None
@@ -51,30 +106,50 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
             }
 
         try:
-            if not data:
-                response = self.downloader.get(url, timeout=timeout, headers=headers, cookies=cookies)
-            else:
-                response = self.downloader.post(url, timeout=timeout, headers=headers, cookies=cookies, data=data)
+            with metrics.timer('crawl_stage_duration_seconds', stage=stage):
+                if not data:
+                    response = self.downloader.get(url, timeout=timeout, headers=headers, cookies=cookies,
+                                                   cache_ttl=cache_ttl)
+                else:
+                    response = self.downloader.post(url, timeout=timeout, headers=headers, cookies=cookies, data=data,
+                                                    cache_ttl=cache_ttl)
 
-            if response:
-                raw_data = response.text
+                if response:
+                    raw_data = response.text
 
         except Exception as e:
             self.logger.error(f'download() error: {str(e)}')
+            self._add_download_failure()
 
         return raw_data
 
-    def download_document(self, url, timeout=100, headers=None, cookies=None, data=None):
+    def _add_download_failure(self):
+        self._download_failures.count = self._get_download_failures() + 1
+
+    def _get_download_failures(self) -> int:
+        return getattr(self._download_failures, 'count', 0)
+
+    def download_document(self, url, timeout=100, headers=None, cookies=None, data=None, cache_ttl=None,
+                          stage='document'):
         """
         :param url: The URL to download content from.
         :param timeout: The timeout for the request in seconds.
         :param headers: Custom headers to be included in the request.
         :param cookies: Cookies to be included in the request.
         :param data: Data to be sent in the request body *(for POST requests)*.
-        :return: Returns downloaded content from the URL *(in bytes or string)*.
+        :param cache_ttl: Seconds a stored document may be reused for. None always downloads.
+        :param stage: Crawl stage the download's duration is recorded under.
+        :return: Returns a document store reference *(path, SHA-256 and size)* to the PDF, or None if the URL didn't
+        return a PDF. The response headers double as a content-type probe: non-PDF responses are closed before their
+        body is read, and PDF bodies are streamed to disk without being held in memory as a whole.
         """
         raw_data = None
 
+        if cache_ttl is not None and not data:
+            raw_data = self.document_store.lookup(url, ttl=cache_ttl)
+            if raw_data:
+                return raw_data
+
         if not isinstance(headers, dict):
             headers = {
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,'
@@ -87,75 +162,201 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
             }
 
         try:
-            if not data:
-                response = self.downloader.get(url, timeout=timeout, headers=headers, cookies=cookies)
-            else:
-                response = self.downloader.post(url, timeout=timeout, headers=headers, cookies=cookies, data=data)
+            with metrics.timer('crawl_stage_duration_seconds', stage=stage):
+                if not data:
+                    response = self.downloader.get(url, timeout=timeout, headers=headers, cookies=cookies,
+                                                   stream=True)
+                else:
+                    response = self.downloader.post(url, timeout=timeout, headers=headers, cookies=cookies,
+                                                    data=data, stream=True)
 
-            if response:
-                if 'application/pdf' in response.headers.get('Content-Type', ''):
-                    raw_data = response.content
+                with response:
+                    if response and 'application/pdf' in response.headers.get('Content-Type', ''):
+                        raw_data = self.document_store.save(
+                            url, response.iter_content(chunk_size=self.document_store.chunk_size))
 
         except Exception as e:
             self.logger.error(f'download_document() error: {str(e)}')
+            self._add_download_failure()
 
         return raw_data
 
-    def crawl(self, urls=None) -> list:
+    def crawl(self, urls=None):
         """
         Crawls through the Wandsworth Planning Application directory and extracts information from all pages needing to
         be extracted.
-        :return: Returns a list of dictionaries containing raw data from pages crawled.
+        :return: Yields a dictionary of raw data for each application as soon as it is crawled.
         """
-        max_pages = 240
+        if self.journal:
+            progress = self.journal.get_progress()
+            if progress['windows'] or progress['records']:
+                self.logger.info(f'Resuming from the journal: {progress["windows"]} search windows and '
+                                 f'{progress["records"]} applications already done')
+            self._completed_urls = self.journal.get_completed_urls()
 
-        if not urls:
-            self.logger.info('Getting general search data...')
-            viewstate, viewstate_generator, event_validation = self._get_general_search_data()
+        application_urls = self.discover(urls)
 
-            self.logger.info('Getting first page data...')
-            first_page_data = self._get_first_page_data(viewstate, viewstate_generator, event_validation)
+        self.logger.info('Getting all page data from each application...')
+        for application_data in self._get_all_page_raw_data(application_urls):
+            if application_data is None:
+                continue
 
-            self.logger.info(f'Getting all application URLs until page {max_pages}')
-            application_urls = self._get_application_urls(first_page_data, max_pages=max_pages)
-            application_urls = [f'{self.base_application_url}{url}' for url in application_urls]
-            self.logger.info(f'Found {len(application_urls)} applications')
-        else:
+            yield application_data
+
+            # Saved only after the record has been consumed, so a crash doesn't mark unprocessed applications as seen.
+            listing_fingerprint, details_fingerprint = self._fingerprints.pop(application_data['source'], (None, None))
+            if self.state and details_fingerprint:
+                self.state.update(application_data['source'], listing_fingerprint, details_fingerprint)
+
+        # Everything has been handed over, so the next crawl starts from scratch.
+        if self.journal:
+            self.journal.clear()
+
+    def discover(self, urls=None, max_pages: int = 240) -> list:
+        """
+        :param urls: Application URLs to use instead of searching for them.
+        :param max_pages: Maximum number of search result pages to follow per window.
+        :return: Returns the URLs of every application found.
+        """
+        if urls:
             self.logger.info('Testing URLs...')
-            application_urls = urls
+            return list(urls)
 
-        self.logger.info('Getting all page data from each application...')
-        all_page_raw_data_list = self._get_all_page_raw_data(application_urls)
+        self.logger.info(f'Getting all application URLs until page {max_pages} of each search window')
+        application_urls = self._search_application_urls(max_pages=max_pages)
+        application_urls = [f'{self.base_application_url}{url}' for url in application_urls]
+        self.logger.info(f'Found {len(application_urls)} applications')
 
-        return all_page_raw_data_list
+        return application_urls
 
-    def _get_general_search_data(self) -> tuple:
-        base_url_data = self.download(self.general_search_url)
+    def fetch(self, url: str):
+        """
+        :param url: Application URL.
+        :return: Returns the raw application data, or None if an incremental crawl found it unchanged. Unlike `crawl()`,
+        raises if the main details page couldn't be downloaded, so that a work queue retries the application.
+        """
+        application_data = self._get_page_raw_data(url)
+        if application_data is not None and not application_data['main_details_data']:
+            raise ConnectionError(f'Could not download the main details page of {url}')
 
-        viewstate = None
-        viewstate_generator = None
-        event_validation = None
+        return application_data
 
-        if base_url_data:
-            base_url_soup = BeautifulSoup(base_url_data, 'lxml')
-            viewstate_tag = base_url_soup.select_one('input#__VIEWSTATE')
-            viewstate_generator_tag = base_url_soup.select_one('input#__VIEWSTATEGENERATOR')
-            event_validation_tag = base_url_soup.select_one('input#__EVENTVALIDATION')
+    def _search_application_urls(self, max_pages: int = 10) -> list:
+        """
+        Splits the search range into date windows and paginates them concurrently. Each window runs on its own server
+        session, since the search results and their "next page" links are tied to the session that ran the search.
+        :param max_pages: Maximum number of pages to follow per window.
+        :return: Returns the application hrefs of every window, newest window first, without duplicates.
+        """
+        date_windows = self._get_date_windows()
+        self.logger.info(f'Searching {len(date_windows)} date windows of {self.shard_days} days')
+
+        application_urls = {}
+        for window_urls in self.map_ordered(lambda date_window: self._search_date_window(*date_window, max_pages),
+                                            date_windows, self.max_shard_workers):
+            application_urls.update(dict.fromkeys(window_urls))
+
+        return list(application_urls)
+
+    def _get_date_windows(self) -> list:
+        """
+        :return: Returns non-overlapping (date_start, date_end) windows covering the last `search_days` days, newest
+        first. Both dates are inclusive, as in the search form.
+        """
+        date_end = self._get_search_end()
+        search_start = date_end - timedelta(days=self.search_days)
+
+        date_windows = []
+        while date_end >= search_start:
+            date_start = max(date_end - timedelta(days=self.shard_days - 1), search_start)
+            date_windows.append((date_start, date_end))
+            date_end = date_start - timedelta(days=1)
+
+        return date_windows
+
+    def _get_search_end(self) -> datetime:
+        """
+        :return: Returns now, or the end of the search of the interrupted crawl being resumed, so that it's split into
+        the same windows.
+        """
+        if not self.journal:
+            return datetime.now()
+
+        search_end = self.journal.get_value('search_end')
+        if search_end:
+            return datetime.fromisoformat(search_end)
+
+        search_end = datetime.now()
+        self.journal.set_value('search_end', search_end.isoformat())
+
+        return search_end
 
-            if viewstate_tag and viewstate_tag.has_attr('value'):
-                viewstate = viewstate_tag['value']
+    def _get_shard(self):
+        """
+        :return: Returns the search shard of the current thread: a shallow copy sharing everything but the server
+        session.
+        """
+        shard = getattr(self._shards, 'shard', None)
+        if shard is None:
+            shard = copy.copy(self)
+            shard.downloader = self.downloader.fork()
+            self._shards.shard = shard
+
+        return shard
+
+    def _search_date_window(self, date_start: datetime, date_end: datetime, max_pages: int) -> list:
+        window = f'{date_start.strftime("%d/%m/%Y")} - {date_end.strftime("%d/%m/%Y")}'
+        if self.journal:
+            application_urls = self.journal.get_window_urls(window)
+            if application_urls is not None:
+                return application_urls
+
+        shard = self._get_shard()
+        first_page_data = None
+        # A reused form state the server no longer accepts is dropped and the search retried with a fresh one.
+        for reuse_form_state in (True, False):
+            viewstate, viewstate_generator, event_validation = shard._get_general_search_data(reuse_form_state)
+            if not viewstate:
+                self.logger.error(f'No search form state for window {window}')
+                return []
+
+            first_page_data = shard._get_first_page_data(viewstate, viewstate_generator, event_validation,
+                                                         date_start=date_start, date_end=date_end)
+            if first_page_data or not shard._is_form_state_reused:
+                break
+
+        if not first_page_data:
+            self.logger.error(f'No search results for window {window}')
+            return []
+
+        application_urls = shard._get_application_urls(first_page_data, max_pages=max_pages, window=window)
+        self.logger.info(f'Found {len(application_urls)} applications in window {window}')
 
-            if viewstate_generator_tag and viewstate_generator_tag.has_attr('value'):
-                viewstate_generator = viewstate_generator_tag['value']
+        return application_urls
+
+    def _get_general_search_data(self, reuse: bool = True) -> tuple:
+        """
+        :param reuse: Use this session's cached form state if it's fresh. False always downloads the search form.
+        :return: Returns the (viewstate, viewstate generator, event validation) of the search form.
+        """
+        session = self.downloader.requester
+        hidden_fields = self.form_states.get(session, self.general_search_url) if reuse else None
+        self._is_form_state_reused = hidden_fields is not None
 
-            if event_validation_tag and event_validation_tag.has_attr('value'):
-                event_validation = event_validation_tag['value']
+        if hidden_fields is None:
+            self.form_states.invalidate(session, self.general_search_url)
+            base_url_data = self.download(self.general_search_url, stage='search_form')
+            hidden_fields = get_hidden_fields(base_url_data) if base_url_data else {}
+            if hidden_fields.get('__VIEWSTATE'):
+                self.form_states.put(session, self.general_search_url, hidden_fields)
 
-        return viewstate, viewstate_generator, event_validation
+        return (hidden_fields.get('__VIEWSTATE'), hidden_fields.get('__VIEWSTATEGENERATOR'),
+                hidden_fields.get('__EVENTVALIDATION'))
 
-    def _get_first_page_data(self, viewstate: str, viewstate_generator: str, event_validation: str) -> str:
-        current_date_time = datetime.now()
-        six_months_ago = current_date_time - timedelta(days=6 * 30)
+    def _get_first_page_data(self, viewstate: str, viewstate_generator: str, event_validation: str,
+                             date_start: datetime = None, date_end: datetime = None) -> str:
+        date_end = date_end or datetime.now()
+        date_start = date_start or date_end - timedelta(days=self.search_days)
 
         default_form_data = f'__VIEWSTATE={quote_plus(viewstate)}&__VIEWSTATEGENERATOR={quote_plus(viewstate_generator)}' \
                             f'&__EVENTVALIDATION={quote_plus(event_validation)}' \
@@ -167,38 +368,84 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
             'cboMonths': '1',
             'cboDays': '1',
             'rbGroup': 'rbRange',
-            'dateStart': six_months_ago.strftime('%d/%m/%Y'),
-            'dateEnd': current_date_time.strftime('%d/%m/%Y'),
+            'dateStart': date_start.strftime('%d/%m/%Y'),
+            'dateEnd': date_end.strftime('%d/%m/%Y'),
             'csbtnSearch': 'Search',
         }
         complete_form_data = f'{default_form_data}&{urlencode(form_data)}'
         first_page_data = self.download(self.general_search_url, headers=self.post_request_headers,
-                                        data=complete_form_data)
+                                        data=complete_form_data, stage='search')
 
         return first_page_data
 
-    def _get_application_urls(self, first_page_data: str, max_pages: int = 10) -> list:
+    def _get_application_urls(self, first_page_data: str, max_pages: int = 10, window: str = None) -> list:
+        """
+        :param first_page_data: First page of search results.
+        :param max_pages: Maximum number of pages to follow.
+        :param window: Search window being paginated. Pages are checkpointed in the journal under it, and the window
+        is marked complete unless pagination stops on a failed download. "Next page" links only work in the session
+        that ran the search, so an incomplete window is paginated again from its first page when resumed.
+        :return: Returns the application hrefs of every page.
+        """
         first_page_soup = BeautifulSoup(first_page_data, 'lxml')
         application_urls = self._get_search_result_data(first_page_soup)
-        next_url = self._get_next_url(first_page_soup)
+        next_url = None if self._is_listing_unchanged(first_page_soup) else self._get_next_url(first_page_soup)
         current_page = 1
+        is_complete = True
+        if self.journal and window:
+            self.journal.add_window_page(window, current_page, application_urls)
+
+        while next_url and current_page < max_pages:
+            self.logger.info('On page %s', current_page, extra=SAMPLED)
+            page_data = self.download(next_url, stage='pagination')
+            if not page_data:
+                self.logger.error(f'Could not download page {current_page + 1}, stopping pagination')
+                is_complete = False
+                break
+
+            page_soup = BeautifulSoup(page_data, 'lxml')
+            page_urls = self._get_search_result_data(page_soup)
+            application_urls.extend(page_urls)
+            if self.journal and window:
+                self.journal.add_window_page(window, current_page + 1, page_urls)
+
+            if self._is_listing_unchanged(page_soup):
+                self.logger.info('Page only lists known, unchanged applications, stopping pagination')
+                break
+
+            next_url = self._get_next_url(page_soup)
+            if not next_url:
+                self.logger.info(f'Next page not found')
+                break
+            else:
+                current_page += 1
 
-        while current_page < max_pages:
-            self.logger.info(f'On page {current_page}')
-            page_data = self.download(next_url)
-            if page_data:
-                page_soup = BeautifulSoup(page_data, 'lxml')
-                application_urls.extend(self._get_search_result_data(page_soup))
-
-                next_url = self._get_next_url(page_soup)
-                if not next_url:
-                    self.logger.info(f'Next page not found')
-                    break
-                else:
-                    current_page += 1
+        if self.journal and window and is_complete:
+            self.journal.complete_window(window)
 
         return application_urls
 
+    def _is_listing_unchanged(self, soup: BeautifulSoup) -> bool:
+        """
+        Fingerprints every search result row on the page. Always False outside incremental mode.
+        :param soup: Search results page.
+        :return: Returns True if every application on the page is known and its row is unchanged since the last run.
+        """
+        if not self.state:
+            return False
+
+        is_unchanged = True
+        for link in soup.select('td.TableData a.data_text'):
+            url = f'{self.base_application_url}{clean_href(link["href"])}'
+            row_tag = link.find_parent('tr') or link
+            listing_fingerprint = get_fingerprint(row_tag.get_text(' '))
+            self._fingerprints[url] = (listing_fingerprint, None)
+
+            if not self.state.is_listing_unchanged(url, listing_fingerprint):
+                is_unchanged = False
+
+        return is_unchanged
+
     def _get_next_url(self, soup: BeautifulSoup) -> str:
         next_url = None
         next_url_tag = None
@@ -212,73 +459,133 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
 
         return next_url
 
-    def _get_all_page_raw_data(self, application_urls: list):
-        all_page_raw_data = []
-        for url in application_urls:
-            self.logger.info(f'Page: {url}')
-            application_data = {
-                'main_details_data': None,
-                'dates_data': None,
-                'document_data': None,
-                'source': url
-            }
-            document_url = None
-            document_data = None
-            application_main_data = self.download(url)
-            if application_main_data:
-                application_data['main_details_data'] = application_main_data
-                application_soup = BeautifulSoup(application_main_data, 'lxml')
+    def _get_all_page_raw_data(self, application_urls):
+        """
+        Fetches every application concurrently, bounded by `max_workers` and the per-host limits of the downloader.
+        :param application_urls: Iterable of application URLs to fetch.
+        :return: Yields raw application data *(None for skipped applications)* in the same order as `application_urls`.
+        """
+        get_page_raw_data = self._get_journaled_page_raw_data if self.journal else self._get_page_raw_data
+        yield from self.map_ordered(get_page_raw_data, application_urls, self.max_workers)
+
+    def _get_journaled_page_raw_data(self, url: str):
+        """
+        Replays an application completed before a restart from the journal, or fetches it and journals the result.
+        """
+        if url in self._completed_urls:
+            raw_data, listing_fingerprint, details_fingerprint = self.journal.get_record(url)
+            if details_fingerprint:
+                self._fingerprints[url] = (listing_fingerprint, details_fingerprint)
 
-                application_date_href = get_application_href(application_soup, 'a[title="Link to the '
-                                                                               'application Dates page."]')
+            return raw_data
 
-                application_dates_url = f'{self.base_application_url}{clean_href(application_date_href)}'
-                if application_dates_url:
-                    application_dates_data = self.download(application_dates_url)
-                    if application_dates_data:
-                        application_data['dates_data'] = application_dates_data
-
-                application_documents_url = get_application_href(application_soup, 'a[title="Link to View Related '
-                                                                                   'Documents"]')
-                if application_documents_url:
-                    application_documents_page_data = self.download(application_documents_url)
-                    if application_documents_page_data:
-                        document_urls = self._get_document_url(application_documents_page_data)
-
-                    if document_urls and isinstance(document_urls, list):
-                        for document_url in document_urls:
-                            # This is for cases when there are more than one document URLs.
-                            document_data = self.download_document(document_url)
-                            if document_data and isinstance(document_data, bytes):
-                                break
-                    else:
-                        document_data = self.download_document(url)
+        raw_data, is_complete = self._fetch_page_raw_data(url)
+        # Applications with a failed download aren't journaled, so a resumed crawl fetches them again.
+        if raw_data is None or is_complete:
+            listing_fingerprint, details_fingerprint = self._fingerprints.get(url, (None, None))
+            self.journal.add_record(url, raw_data, listing_fingerprint, details_fingerprint)
 
+        return raw_data
+
+    def _get_page_raw_data(self, url: str):
+        """
+        :param url: Application URL.
+        :return: Returns the raw application data, or None if an incremental crawl found it unchanged.
+        """
+        return self._fetch_page_raw_data(url)[0]
+
+    def _fetch_page_raw_data(self, url: str) -> tuple:
+        """
+        :param url: Application URL.
+        :return: Returns a (raw_data, is_complete) tuple. raw_data is None if an incremental crawl found the
+        application unchanged. is_complete is False if any of the application's downloads failed.
+        """
+        self.logger.info('Page: %s', url, extra=SAMPLED)
+        application_data = RawApplication(source=url)
+        document_urls = None
+        document_data = None
+        listing_fingerprint = details_fingerprint = None
+        download_failures = self._get_download_failures()
+        # Incremental runs always revalidate the details page, since that is where changes show up.
+        application_main_data = self.download(url, cache_ttl=0 if self.state else self.cache_ttl,
+                                              stage='details')
+        if application_main_data:
+            application_data.main_details_data = application_main_data
+            application_soup = BeautifulSoup(application_main_data, 'lxml')
+
+            if self.state:
+                listing_fingerprint = self._fingerprints.get(url, (None, None))[0]
+                details_fingerprint = get_fingerprint(application_soup.get_text(' '))
+                if self.state.is_unchanged(url, listing_fingerprint, details_fingerprint):
+                    self.logger.info('Skipping unchanged application: %s', url, extra=SAMPLED)
+                    metrics.increment('crawl_applications_total', result='skipped')
+                    self._fingerprints.pop(url, None)
+                    return None, True
+
+            application_date_href = get_application_href(application_soup, 'a[title="Link to the '
+                                                                           'application Dates page."]')
+
+            if application_date_href and self._needs_page('dates_data'):
+                application_dates_url = f'{self.base_application_url}{clean_href(application_date_href)}'
+                application_dates_data = self.download(application_dates_url, cache_ttl=self.cache_ttl,
+                                                       stage='dates')
+                if application_dates_data:
+                    application_data.dates_data = application_dates_data
+
+            application_documents_url = get_application_href(application_soup, 'a[title="Link to View Related '
+                                                                               'Documents"]')
+            if application_documents_url and self._needs_page('document_data'):
+                application_documents_page_data = self.download(application_documents_url,
+                                                                cache_ttl=self.cache_ttl, stage='documents_page')
+                if application_documents_page_data:
+                    document_urls = self._get_document_url(application_documents_page_data)
+
+                # Candidates are ranked, and each download is a streamed GET that is closed as soon as its headers
+                # show it isn't a PDF, so only the chosen document's body is transferred.
+                for document_url in document_urls or []:
+                    document_data = self.download_document(document_url, cache_ttl=self.cache_ttl)
                     if document_data:
-                        application_data['document_data'] = document_data
+                        break
+
+                if document_data:
+                    application_data.document_data = document_data
 
-            all_page_raw_data.append(application_data)
+        # The fingerprint marks the application as seen, so it's only recorded once every page it needs was
+        # downloaded. Otherwise the next incremental crawl would skip it and never fetch the missing pages. Crawls
+        # restricted to some pages never record it, since a full crawl still has to fetch the others.
+        is_complete = self._get_download_failures() == download_failures
+        if details_fingerprint and is_complete and self.pages is None:
+            self._fingerprints[url] = (listing_fingerprint, details_fingerprint)
+        else:
+            self._fingerprints.pop(url, None)
 
-        return all_page_raw_data
+        metrics.increment('crawl_applications_total', result='fetched' if application_main_data else 'failed')
+        return application_data, is_complete
+
+    def _needs_page(self, page: str) -> bool:
+        return self.pages is None or page in self.pages
 
     def _get_document_url(self, page_data: str):
-        soup = BeautifulSoup(page_data, 'lxml')
+        """
+        :param page_data: Related documents page of an application.
+        :return: Returns the ranked candidate URLs of the application form document, or None if there aren't any.
+        """
+        # Only table rows and labels are needed, so the rest of the page, form state included, isn't built as a tree.
+        soup = BeautifulSoup(page_data, 'lxml', parse_only=SoupStrainer(['tr', 'span']))
+        hidden_fields = get_hidden_fields(page_data)
 
         document_urls = None
-        viewstate = None
-        viewstate_generator = None
-        event_validation = None
+        viewstate = hidden_fields.get('__VIEWSTATE')
+        viewstate_generator = hidden_fields.get('__VIEWSTATEGENERATOR')
+        event_validation = hidden_fields.get('__EVENTVALIDATION')
         event_target = None
         case_no = None
 
-        viewstate_tag = soup.select_one('input#__VIEWSTATE')
-        viewstate_generator_tag = soup.select_one('input#__VIEWSTATEGENERATOR')
-        event_validation_tag = soup.select_one('input#__EVENTVALIDATION')
         application_form_tag = soup.select_one('span:-soup-contains("Application Form")')
         case_no_tag = soup.select_one('span#lblCaseNo')
 
         if not application_form_tag:
-            self.logger.info('No document URL for this application.')
+            self.logger.info('No document URL for this application.', extra=SAMPLED)
             return document_urls
         else:
             event_target_pattern = r'gvDocs\$ctl\d+\$lnkDShow'
@@ -288,15 +595,6 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
                 if event_target_match:
                     event_target = event_target_match.group(0)
 
-        if viewstate_tag and viewstate_tag.has_attr('value'):
-            viewstate = viewstate_tag['value']
-
-        if viewstate_generator_tag and viewstate_generator_tag.has_attr('value'):
-            viewstate_generator = viewstate_generator_tag['value']
-
-        if event_validation_tag and event_validation_tag.has_attr('value'):
-            event_validation = event_validation_tag['value']
-
         if case_no_tag:
             case_no = case_no_tag.get_text()
 
@@ -310,24 +608,37 @@ class WandsworthGovUkCrawlingStrategy(CrawlingStrategy):
 
             page_url = f'https://planning2.wandsworth.gov.uk/planningcase/comments.aspx?case={quote_plus(case_no)}'
 
-            headers = self.post_request_headers
-            headers['Origin'] = 'https://planning2.wandsworth.gov.uk'
-            headers['Referer'] = page_url
+            headers = get_request_headers(self.post_request_headers, Origin='https://planning2.wandsworth.gov.uk',
+                                          Referer=page_url)
 
-            post_page_data = self.download(page_url, headers=self.post_request_headers, data=form_data)
+            post_page_data = self.download(page_url, headers=headers, data=form_data, cache_ttl=self.cache_ttl,
+                                           stage='comments_post')
             if post_page_data:
-                post_page_soup = BeautifulSoup(post_page_data, 'lxml')
+                post_page_soup = BeautifulSoup(post_page_data, 'lxml', parse_only=SoupStrainer(['tr', 'a']))
                 document_tags = post_page_soup.select('a[target="_blank"]')
-
-                if len(document_tags) > 1:
-                    document_urls = [tag['href'] for tag in document_tags if tag and tag.has_attr('href')]
-                else:
-                    document_tag = document_tags[0]
-                    if document_tag and document_tag.has_attr('href'):
-                        document_urls = document_tag['href']
+                document_urls = self._rank_document_urls(
+                    [tag for tag in document_tags if tag and tag.has_attr('href')]) or None
 
         return document_urls
 
+    @staticmethod
+    def _rank_document_urls(document_tags: list) -> list:
+        """
+        :param document_tags: Candidate document links.
+        :return: Returns the candidate hrefs, most likely Application Form PDF first: links mentioning the application
+        form, then links to .pdf files, then the rest in page order.
+        """
+        def rank(document_tag):
+            row_tag = document_tag.find_parent('tr') or document_tag
+            href = document_tag['href'].lower()
+            if 'application form' in row_tag.get_text(' ').lower() or 'application_form' in href:
+                return 0
+            if urlsplit(href).path.endswith('.pdf'):
+                return 1
+            return 2
+
+        return [document_tag['href'] for document_tag in sorted(document_tags, key=rank)]
+
     @staticmethod
     def _get_search_result_data(soup) -> list:
         search_results = []
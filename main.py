@@ -1,63 +1,264 @@
-import importlib
-import json
+import argparse
+import logging
 import os
-import pickle
+import sys
+import time
 
-import pandas as pd
-import urllib3
-
-urllib3.disable_warnings()
+from base.logger import Logger, configure as configure_logging
+from base.metrics import metrics
+from base.registry import registry
 
 
 def get_crawling_strategy(website_name: str):
-    with open("map.json", "r") as file:
-        mapping = json.load(file)
-        file_name = mapping[website_name]
+    return registry.get_crawling_strategy(website_name)
 
-    module = importlib.import_module(f'crawler.{file_name}')
-    class_name = f"{''.join([element.capitalize() for element in file_name.split('_')])}CrawlingStrategy"
-    crawling_strategy = getattr(module, class_name)
 
-    return crawling_strategy
+def get_parsing_strategy(website_name: str):
+    return registry.get_parsing_strategy(website_name)
 
 
-def get_parsing_strategy(website_name: str):
-    with open("map.json", "r") as file:
-        mapping = json.load(file)
-        file_name = mapping[website_name]
+def get_argument_parser() -> argparse.ArgumentParser:
+    argument_parser = argparse.ArgumentParser(description='Crawl and parse council planning applications.')
+    argument_parser.add_argument('--website', nargs='+', default=['planning.wandsworth.gov.uk'],
+                                 help="Website keys from map.json, or 'all'. Several websites run concurrently.")
+    argument_parser.add_argument('--global-workers', type=int, default=16,
+                                 help='Requests in flight across every website when running several.')
+    argument_parser.add_argument('--stage', choices=['all', 'crawl', 'parse', 'enqueue', 'work', 'collect'],
+                                 default='all',
+                                 help="'crawl' only writes raw records, 'parse' only reads them back. 'enqueue' puts "
+                                      "the application URLs in the work queue, 'work' fetches and parses queued "
+                                      "applications *(run any number of workers)*, 'collect' writes their results.")
+    argument_parser.add_argument('--urls', nargs='*', default=[], help='Crawl these application URLs only.')
+    argument_parser.add_argument('--raw-file', default='output/raw_data.pkl',
+                                 help='Raw records written by the crawl stage and read by the parse stage.')
+    argument_parser.add_argument('--incremental', action='store_true',
+                                 help='Only fetch applications that are new or changed since the last run. Not '
+                                      "supported by the 'work' stage.")
+    argument_parser.add_argument('--journal', default='output/crawl_journal.sqlite',
+                                 help='Crawl journal an interrupted crawl resumes from.')
+    argument_parser.add_argument('--restart', action='store_true',
+                                 help='Discard the journal of an interrupted crawl and start over.')
+    argument_parser.add_argument('--queue', default='output/work_queue.sqlite',
+                                 help='Work queue file shared by the coordinator and its workers.')
+    argument_parser.add_argument('--lease-seconds', type=float, default=300.0,
+                                 help='Seconds a worker has to finish an application before it is handed to another.')
+    argument_parser.add_argument('--worker-id', help='Worker ID in the work queue. Defaults to <hostname>-<pid>.')
+    argument_parser.add_argument('--max-workers', type=int, help='Applications fetched concurrently.')
+    argument_parser.add_argument('--fields', nargs='+',
+                                 help='Only output these fields, and only fetch the pages they are read from.')
+    argument_parser.add_argument('--processes', type=int, default=1,
+                                 help='Worker processes for parsing. 0 uses every CPU core.')
+    argument_parser.add_argument('--format', dest='output_format', choices=['csv', 'jsonl', 'parquet'], default='csv')
+    argument_parser.add_argument('--mode', dest='output_mode', choices=['w', 'a'], default='w',
+                                 help="'w' overwrites the output, 'a' appends to it.")
+    argument_parser.add_argument('--partition-by', help="Field to partition the output by, e.g. 'received'.")
+    argument_parser.add_argument('--output', help='Output file, or directory when partitioning.')
+    argument_parser.add_argument('--metrics-dir', default='output',
+                                 help='Directory metrics.json and metrics.prom are written to.')
+    argument_parser.add_argument('--metrics-interval', type=float,
+                                 help='Also export metrics every this many seconds while running.')
+    argument_parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='DEBUG')
+    argument_parser.add_argument('--log-json', action='store_true', help='Log one JSON object per line.')
+    argument_parser.add_argument('--log-sample', type=int, default=1,
+                                 help='Only log every n-th per-page info line.')
 
-    module = importlib.import_module(f'parser.{file_name}')
-    class_name = f"{''.join([element.capitalize() for element in file_name.split('_')])}ParsingStrategy"
-    parsing_strategy = getattr(module, class_name)
+    return argument_parser
 
-    return parsing_strategy
 
+def get_website_path(args, path: str, website: str) -> str:
+    """
+    :return: Returns `path` unchanged for a single website. When running several, each website gets its own
+    subdirectory, so their files don't collide.
+    """
+    if len(args.website) == 1:
+        return path
 
-if __name__ == '__main__':
-    country = 'uk'
-    website = 'planning.wandsworth.gov.uk'
-    raw_data_file = 'output/raw_data.pkl'
-    use_local_file = True
-    # For testing specific URLs.
-    urls = []
+    directory, file_name = os.path.split(path)
+    return os.path.join(directory, website, file_name)
+
+
+def get_parsed_fields(args):
+    """
+    :return: Returns the fields to parse: the output fields, plus the partition field, which has to be parsed even when
+    it isn't output. None parses every field.
+    """
+    if args.fields and args.partition_by and args.partition_by not in args.fields:
+        return [*args.fields, args.partition_by]
+
+    return args.fields
+
+
+def get_crawler(args, website: str, scheduler=None, journal: bool = True):
+    # Only crawling needs the HTTP stack, so it's imported here rather than at startup.
+    import urllib3
+    urllib3.disable_warnings()
+
+    crawling_strategy = get_crawling_strategy(website)
+    state_file = get_website_path(args, 'output/crawl_state.sqlite', website) if args.incremental else None
+    journal_file = get_website_path(args, args.journal, website) if journal else None
+    fields = get_parsed_fields(args)
+    pages = get_parsing_strategy(website).get_required_pages(fields) if fields else None
+    crawler = crawling_strategy(max_workers=args.max_workers, state_file=state_file, journal_file=journal_file,
+                                pages=pages)
+    if args.restart and crawler.journal:
+        crawler.journal.clear()
+
+    if scheduler:
+        crawler.downloader.limiter = scheduler.get_site_limiter(website, crawler.max_workers,
+                                                                crawling_strategy.min_request_interval)
+
+    return crawler
+
+
+def crawl(args, website: str, scheduler=None):
+    crawler = get_crawler(args, website, scheduler)
+
+    # Re-runs are served from the crawler's HTTP response cache, so only missing or stale pages hit the network, and
+    # an interrupted crawl picks up where its journal left off.
+    return crawler.crawl(args.urls)
+
+
+def parse(args, website: str, raw_data_iter) -> int:
+    parser = get_parsing_strategy(website)(fields=get_parsed_fields(args))
+
+    return write(args, website, parser.parse(raw_data_iter, processes=args.processes or None))
+
+
+def write(args, website: str, data_iter) -> int:
+    from base.writer import get_writer
+
+    output_path = args.output or ('output/partitions' if args.partition_by else f'output/output.{args.output_format}')
+    output_path = get_website_path(args, output_path, website)
+
+    with get_writer(args.output_format, output_path, mode=args.output_mode, partition_by=args.partition_by,
+                    fields=args.fields) as writer:
+        row_count = writer.write_all(data_iter)
+
+    print(f'Wrote {row_count} rows to {output_path}')
+    return row_count
 
-    crawler = get_crawling_strategy(website)()
-    parser = get_parsing_strategy(website)()
 
-    if os.path.exists(raw_data_file) and use_local_file:
-        with open(raw_data_file, "rb") as pickle_file:
-            raw_data_list = pickle.load(pickle_file)
+def enqueue(args, website: str, work_queue):
+    crawler = get_crawler(args, website)
+    added_count = work_queue.enqueue(website, crawler.discover(args.urls))
+    # The search is over, so its checkpoints aren't needed to resume anything.
+    crawler.journal.clear()
 
+    print(f'Queued {added_count} new applications of {website}: {work_queue.get_counts(website)}')
+
+
+def work(args, work_queue) -> int:
+    """
+    Leases applications from the work queue, fetches and parses them, and acks each with its parsed record, until no
+    application is left. Failed applications are handed back to be retried.
+    :return: Returns the number of applications acked.
+    """
+    import socket
+    from base.crawler import CrawlingStrategy
+
+    worker_id = args.worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    # Workers don't journal: the queue already tracks what is done, and workers may share a directory.
+    crawlers = {website: get_crawler(args, website, journal=False) for website in args.website}
+    parsers = {website: get_parsing_strategy(website)(fields=get_parsed_fields(args)) for website in args.website}
+    max_workers = max(crawler.max_workers for crawler in crawlers.values())
+
+    def process(item) -> bool:
+        item_id, website, url = item
+        try:
+            raw_data = crawlers[website].fetch(url)
+            data = None if raw_data is None else parsers[website].parse_record(raw_data)
+        except Exception as e:
+            work_queue.fail(item_id, worker_id, repr(e))
+            return False
+
+        return work_queue.ack(item_id, worker_id, data)
+
+    acked_count = 0
+    while not work_queue.is_drained(args.website):
+        items = work_queue.lease(args.website, worker_id, lease_seconds=args.lease_seconds, count=max_workers)
+        if not items:
+            # Every remaining application is leased by another worker. Wait for it to be acked or its lease to expire.
+            time.sleep(1)
+            continue
+
+        acked_count += sum(CrawlingStrategy.map_ordered(process, items, max_workers))
+
+    print(f'Worker {worker_id} acked {acked_count} applications')
+    return acked_count
+
+
+def run_website(args, website: str, scheduler=None):
+    raw_file = get_website_path(args, args.raw_file, website)
+
+    if args.stage == 'crawl':
+        from base.raw_store import write_raw_records
+
+        record_count = sum(1 for _ in write_raw_records(crawl(args, website, scheduler), raw_file))
+        print(f'Wrote {record_count} raw records to {raw_file}')
+    elif args.stage == 'parse':
+        from base.raw_store import read_raw_records
+
+        parse(args, website, read_raw_records(raw_file))
+    elif args.stage == 'enqueue':
+        from base.work_queue import WorkQueue
+
+        enqueue(args, website, WorkQueue(args.queue))
+    elif args.stage == 'collect':
+        from base.work_queue import WorkQueue
+
+        write(args, website, WorkQueue(args.queue).get_results(website))
     else:
-        raw_data_list = crawler.crawl(urls)
-        if not urls:
-            with open(raw_data_file, "wb") as pickle_file:
-                pickle.dump(raw_data_list, pickle_file)
+        parse(args, website, crawl(args, website, scheduler))
+
+
+def main(argv=None) -> int:
+    """
+    :return: Returns the exit status: 1 if any website failed, otherwise 0.
+    """
+    argument_parser = get_argument_parser()
+    args = argument_parser.parse_args(argv)
+    if args.stage == 'work' and args.incremental:
+        # Workers fetch single applications and never record crawl state, so the flag would only cost requests.
+        argument_parser.error("--incremental isn't supported by --stage work")
+    if args.website == ['all']:
+        args.website = registry.get_websites()
+    start_time = time.perf_counter()
+    configure_logging(level=logging.getLevelName(args.log_level), json_format=args.log_json,
+                      sample_every={logging.INFO: args.log_sample})
+    logger = Logger('main').logger
+    failed_websites = []
+
+    if args.metrics_interval:
+        metrics.start_periodic_export(args.metrics_interval, args.metrics_dir)
 
-    data_list = parser.parse(raw_data_list)
-    df = pd.DataFrame(data_list)
-    csv_file = 'output/output.csv'
+    try:
+        if args.stage == 'work':
+            from base.work_queue import WorkQueue
 
-    df.to_csv(csv_file, index=False)
+            work(args, WorkQueue(args.queue))
+        elif len(args.website) == 1:
+            run_website(args, args.website[0])
+        else:
+            from base.scheduler import Scheduler
 
-    print(data_list)
+            # Each website runs on its own thread within its own budget, sharing a fair, global request cap.
+            scheduler = Scheduler(max_workers=args.global_workers)
+            results = scheduler.run(args.website, lambda website: run_website(args, website, scheduler))
+            for website, result in results.items():
+                if isinstance(result, Exception):
+                    logger.error('%s failed: %r', website, result, exc_info=result)
+                    failed_websites.append(website)
+    finally:
+        metrics.stop_periodic_export()
+        metrics.export(args.metrics_dir)
+
+    print(f'Finished in {time.perf_counter() - start_time:.1f}s')
+    if failed_websites:
+        print(f'Failed websites: {", ".join(failed_websites)}')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
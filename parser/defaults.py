@@ -1,6 +1,8 @@
 from enum import Enum
 
+from base import records
+
 
 class Defaults(Enum):
-    NOT_FOUND = 'None'
-    EXTRACTION_ERROR = 'EXTRACTION_ERROR'
+    NOT_FOUND = records.NOT_FOUND
+    EXTRACTION_ERROR = records.EXTRACTION_ERROR
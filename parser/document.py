@@ -0,0 +1,48 @@
+import re
+
+
+class DocumentFieldExtractor:
+    """
+    Extracts several regex fields from a PyPDF2 document in one pass. Page text is extracted once, page by page, and
+    extraction stops as soon as every field has matched or the page budget is spent. Each page is scanned once,
+    together with the end of the page before it, so a value split across a page break is still found.
+    """
+    page_overlap = 256  # Characters of the previous page's text a match may start in
+
+    def __init__(self, patterns: dict, max_pages: int = None):
+        """
+        :param patterns: Maps a field name to a regex whose first group is the field value.
+        :param max_pages: Maximum number of pages to extract text from. None reads the whole document if needed.
+        """
+        self.patterns = {field: re.compile(pattern) for field, pattern in patterns.items()}
+        self.max_pages = max_pages
+
+    def extract(self, document) -> dict:
+        """
+        :param document: PyPDF2 PdfReader. Its pages are only loaded as they are read.
+        :return: Returns a dictionary mapping each matched field to its unique values, in order of appearance.
+        Fields that never matched are left out.
+        """
+        # Field -> dictionary of its matches, used as an ordered set.
+        matches = {}
+        previous_text = ''
+
+        for page_number, page in enumerate(document.pages):
+            if self.max_pages is not None and page_number >= self.max_pages:
+                break
+
+            page_text = re.sub(r'\s+', ' ', page.extract_text().strip())
+            text = f'{previous_text} {page_text}' if previous_text and page_text else previous_text or page_text
+
+            for field, pattern in self.patterns.items():
+                for match in pattern.finditer(text):
+                    # Matches that end within the previous page were found when that page was scanned.
+                    if match.end() > len(previous_text):
+                        matches.setdefault(field, {})[match.group(1)] = None
+
+            if len(matches) == len(self.patterns):
+                break
+
+            previous_text = text[-self.page_overlap:]
+
+        return {field: list(field_matches) for field, field_matches in matches.items()}
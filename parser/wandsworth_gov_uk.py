@@ -1,112 +1,161 @@
-import copy
-import io
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
 from PyPDF2 import PdfReader
 
+from base.document_store import open_document
 from base.parser import ParsingStrategy
-from base.logger import Logger
+from base.logger import SAMPLED, Logger
+from base.metrics import metrics
+from base.records import PlanningApplication
 from parser.defaults import Defaults
+from parser.document import DocumentFieldExtractor
 
 
 class WandsworthGovUkParsingStrategy(ParsingStrategy):
-    def __init__(self):
+    document_patterns = {
+        'easting': r'Easting \(x\) (\d+)Northing',
+        'northing': r'\(y\) (\d+)',
+        'planning_portal_reference': r'(PP-\d{7})',
+    }
+    field_sources = {
+        **dict.fromkeys(['council_decision', 'application_number', 'application_type', 'site_address', 'proposal',
+                         'appeal_submitted', 'appeal_decision', 'appeal_date_lodged', 'appeal_decision_date'],
+                        'main_details_data'),
+        **dict.fromkeys(['received', 'registered', 'decision_expiry'], 'dates_data'),
+        **dict.fromkeys(document_patterns, 'document_data'),
+        'source': None,
+    }
+
+    def __init__(self, document_max_pages: int = None, fields: list = None):
+        """
+        :param document_max_pages: Maximum number of PDF pages to read per document. None reads until every document
+        field is found.
+        :param fields: Fields needed in the output. None parses every field. Pages none of them are read from aren't
+        parsed, and the fields read from those pages keep their defaults. Writers pick the output fields.
+        """
         self.logger = Logger(self.__class__.__name__).logger
-        self.data_template = {
-            'council_decision': Defaults.NOT_FOUND.value, 'application_number': Defaults.NOT_FOUND.value,
-            'application_type': Defaults.NOT_FOUND.value, 'site_address': Defaults.NOT_FOUND.value,
-            'proposal': Defaults.NOT_FOUND.value, 'appeal_submitted': Defaults.NOT_FOUND.value,
-            'appeal_decision': Defaults.NOT_FOUND.value, 'appeal_date_lodged': Defaults.NOT_FOUND.value,
-            'appeal_decision_date': Defaults.NOT_FOUND.value, 'received': Defaults.NOT_FOUND.value,
-            'registered': Defaults.NOT_FOUND.value, 'decision_expiry': Defaults.NOT_FOUND.value,
-            'easting': Defaults.NOT_FOUND.value, 'northing': Defaults.NOT_FOUND.value,
-            'planning_portal_reference': Defaults.NOT_FOUND.value, 'source': None
-        }
-
-    def parse(self, raw_data_list: list):
-        data_list = []
-        for raw_data in raw_data_list:
-            data = copy.deepcopy(self.data_template)
-
-            main_details_soup = None
-            dates_soup = None
-            document = None
-
-            if 'main_details_data' in raw_data and raw_data['main_details_data']:
-                main_details_soup = BeautifulSoup(raw_data['main_details_data'], 'lxml')
-                application_number = None if not main_details_soup \
-                    else self.get_table_value(main_details_soup, 'Application Number')
-
-                # Uncomment for testing specific application numbers
-                # if application_number not in ['2023/2441']:
-                #     self.logger.info(f'Skipping Application Number: {application_number}')
-                #     continue
+        self.required_pages = self.get_required_pages(fields) if fields else set(self.field_sources.values())
+        self.document_extractor = DocumentFieldExtractor(self.document_patterns, max_pages=document_max_pages)
 
-                self.logger.info(f'Parsing through Application Number: {application_number}')
-
-            if 'dates_data' in raw_data and raw_data['dates_data']:
-                dates_soup = BeautifulSoup(raw_data['dates_data'], 'lxml')
+    def parse_record(self, raw_data: dict):
+        data = PlanningApplication()
 
-            if 'document_data' in raw_data and raw_data['document_data']:
-                document_byte_stream = io.BytesIO(raw_data['document_data'])
-                document = PdfReader(document_byte_stream)
+        main_details_soup = None
+        dates_soup = None
 
-            if 'source' in raw_data and raw_data['source']:
-                data['source'] = raw_data['source']
+        # Always parsed, since the application number is logged.
+        if 'main_details_data' in raw_data and raw_data['main_details_data']:
+            with metrics.timer('parse_html_duration_seconds', page='main_details'):
+                main_details_soup = BeautifulSoup(raw_data['main_details_data'], 'lxml')
+                main_details_index = self.get_table_index(main_details_soup)
+            application_number = None if not main_details_soup \
+                else self.get_table_value(main_details_index, 'Application Number')
 
-            if main_details_soup:
-                data['application_number'] = application_number
-                data['appeal_decision'], data['appeal_decision_date'] = self.get_decision_values(main_details_soup)
-                data['council_decision'] = f"{data['appeal_decision']} {data['appeal_decision_date']}"
+            # Uncomment for testing specific application numbers
+            # if application_number not in ['2023/2441']:
+            #     self.logger.info(f'Skipping Application Number: {application_number}')
+            #     return None
 
-                data['application_type'] = self.get_table_value(main_details_soup, 'Application Type')
-                data['site_address'] = self.get_table_value(main_details_soup, 'Site Address')
-                data['proposal'] = self.get_table_value(main_details_soup, 'Proposal')
-                data['appeal_submitted'] = self.get_table_value(main_details_soup, 'Appeal Submitted?')
-                data['appeal_date_lodged'] = self.get_table_value(main_details_soup, 'Appeal Lodged')
+            self.logger.info('Parsing through Application Number: %s', application_number, extra=SAMPLED)
 
-            if dates_soup:
-                data['received'] = self.get_table_value(dates_soup, 'Received?')
-                data['registered'] = self.get_table_value(dates_soup, 'Registered')
-                data['decision_expiry'] = self.get_table_value(dates_soup, 'Decision Expiry')
+        if 'dates_data' in self.required_pages and 'dates_data' in raw_data and raw_data['dates_data']:
+            with metrics.timer('parse_html_duration_seconds', page='dates'):
+                dates_soup = BeautifulSoup(raw_data['dates_data'], 'lxml')
+                dates_index = self.get_table_index(dates_soup)
+
+        if 'source' in raw_data and raw_data['source']:
+            data.source = raw_data['source']
+
+        if main_details_soup:
+            data.application_number = application_number
+            data.appeal_decision, data.appeal_decision_date = self.get_decision_values(main_details_index)
+            data.council_decision = f'{data.appeal_decision} {data.appeal_decision_date}'
+
+            data.application_type = self.get_table_value(main_details_index, 'Application Type')
+            data.site_address = self.get_table_value(main_details_index, 'Site Address')
+            data.proposal = self.get_table_value(main_details_index, 'Proposal')
+            data.appeal_submitted = self.get_table_value(main_details_index, 'Appeal Submitted?')
+            data.appeal_date_lodged = self.get_table_value(main_details_index, 'Appeal Lodged')
+
+        if dates_soup:
+            data.received = self.get_table_value(dates_index, 'Received?')
+            data.registered = self.get_table_value(dates_index, 'Registered')
+            data.decision_expiry = self.get_table_value(dates_index, 'Decision Expiry')
+
+        if 'document_data' in self.required_pages and 'document_data' in raw_data and raw_data['document_data']:
+            # Opened lazily: the stored PDF is memory-mapped and only the pages read are loaded.
+            try:
+                with open_document(raw_data['document_data']) as document_stream:
+                    document_values = self.get_document_values(PdfReader(document_stream))
+            except Exception as e:
+                # E.g. the stored document was deleted, or isn't a readable PDF.
+                self.logger.error(f'open_document() error: {str(e)}')
+                document_values = dict.fromkeys(self.document_patterns, Defaults.EXTRACTION_ERROR.value)
+
+            for field, value in document_values.items():
+                setattr(data, field, value)
+
+        return data
+
+    def get_document_values(self, document) -> dict:
+        """
+        :param document: PyPDF2 PdfReader of the application form.
+        :return: Returns a dictionary with a value for every field in `document_patterns`.
+        """
+        values = dict.fromkeys(self.document_patterns, Defaults.NOT_FOUND.value)
+        try:
+            with metrics.timer('parse_field_duration_seconds', field='document'):
+                for field, matches in self.document_extractor.extract(document).items():
+                    values[field] = ' '.join(matches)
 
-            if document:
-                data['easting'] = self.get_document_values(document, r'Easting \(x\) (\d+)Northing')
-                data['northing'] = self.get_document_values(document, r"\(y\) (\d+)")
-                data['planning_portal_reference'] = self.get_document_values(document, r"(PP-\d{7})")
+        except Exception as e:
+            self.logger.error(f'get_document_values() error: {str(e)}')
+            values = dict.fromkeys(self.document_patterns, Defaults.EXTRACTION_ERROR.value)
 
-            data_list.append(data)
+        return values
 
-        return data_list
+    @staticmethod
+    def get_table_index(soup) -> dict:
+        """
+        Indexes every label span of a page in a single traversal, so fields can be read without searching or copying
+        the tree again.
+        :param soup: BeautifulSoup object of a main details or dates page.
+        :return: Returns a dictionary mapping each label to its span tag. The first span wins for repeated labels.
+        """
+        table_index = {}
+        for span_tag in soup.find_all('span'):
+            label = span_tag.string
+            if label is None:
+                continue
 
-    def get_document_values(self, document, pattern: str) -> str:
-        value = Defaults.NOT_FOUND.value
-        try:
-            page_text = ' '.join([page.extract_text() for page in document.pages]).strip()
-            page_text = re.sub(r'\s+', ' ', page_text)
+            # Matches the old `^label$` search, where `$` also allowed a single trailing newline.
+            if label.endswith('\n'):
+                label = label[:-1]
 
-            matches = list(re.finditer(pattern, page_text))
-            if matches:
-                value = ' '.join(set([match.group(1) for match in matches]))
+            table_index.setdefault(str(label), span_tag)
 
-        except Exception as e:
-            self.logger.error(f'get_document_values() error: {str(e)}')
-            value = Defaults.EXTRACTION_ERROR.value
+        return table_index
 
-        return value
+    def get_table_value(self, table_index: dict, column_name: str) -> str:
+        with metrics.timer('parse_field_duration_seconds', field=column_name):
+            return self._get_table_value(table_index, column_name)
 
-    def get_table_value(self, soup, column_name: str) -> str:
+    def _get_table_value(self, table_index: dict, column_name: str) -> str:
         value = Defaults.NOT_FOUND.value
-        soup_copy = copy.deepcopy(soup)
         try:
-            pattern = re.compile(f'^' + re.escape(column_name) + '$')
-            child_tag = soup_copy.find('span', text=pattern)
+            child_tag = table_index.get(column_name)
             if child_tag:
                 parent_tag = child_tag.parent
-                child_tag.decompose()
+                # The parent's text without the label span's text, read in place rather than decomposing a copy.
+                label_strings = {id(element) for element in child_tag.descendants}
+                string_types = parent_tag.interesting_string_types
+                if isinstance(string_types, type):
+                    string_types = (string_types,)
 
-                tag_text = parent_tag.get_text().strip()
+                tag_text = ''.join(str(element) for element in parent_tag.descendants
+                                   if isinstance(element, NavigableString) and type(element) in string_types
+                                   and id(element) not in label_strings).strip()
 
                 if tag_text:
                     value = tag_text
@@ -117,12 +166,12 @@ class WandsworthGovUkParsingStrategy(ParsingStrategy):
 
         return value
 
-    def get_decision_values(self, soup) -> list:
+    def get_decision_values(self, table_index: dict) -> list:
         decision_text = Defaults.NOT_FOUND.value
         decision_date = Defaults.NOT_FOUND.value
 
         try:
-            extracted_value = self.get_table_value(soup, 'Decision')
+            extracted_value = self.get_table_value(table_index, 'Decision')
             if extracted_value not in [Defaults.NOT_FOUND.value, Defaults.EXTRACTION_ERROR.value]:
                 cleaned_string = re.sub(r'\s+', ' ', extracted_value)
                 date_pattern = r'\d{2}/\d{2}/\d{4}'
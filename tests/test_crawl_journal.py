@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from base.retry import RetryPolicy
+from benchmarks import fixtures
+from benchmarks.replay_server import ReplayServer
+from crawler.wandsworth_gov_uk import WandsworthGovUkCrawlingStrategy
+
+
+@pytest.fixture
+def replay_server():
+    replay_server = ReplayServer(application_count=3).start()
+    yield replay_server
+    replay_server.stop()
+
+
+def get_crawler(replay_server, directory, failing_url=None):
+    crawler = WandsworthGovUkCrawlingStrategy(max_workers=1, cache_directory=None,
+                                              document_directory=os.path.join(directory, 'documents'),
+                                              journal_file=os.path.join(directory, 'journal.sqlite'))
+    crawler.downloader.url_rewrites = replay_server.get_url_rewrites()
+    crawler.downloader.retry_policy = RetryPolicy(max_attempts=1)
+
+    if failing_url:
+        get = crawler.downloader.get
+
+        def failing_get(url, **kwargs):
+            if url == failing_url:
+                raise ConnectionError(f'Connection refused: {url}')
+            return get(url, **kwargs)
+
+        crawler.downloader.get = failing_get
+
+    return crawler
+
+
+def test_resume_refetches_failed_application(replay_server, tmp_path):
+    crawler = get_crawler(replay_server, tmp_path)
+    urls = [f'{crawler.base_application_url}StdDetails.aspx?{fixtures.DETAILS_QUERY.format(pk=application.pk)}'
+            for application in replay_server.applications]
+
+    # The details page of the second application fails, and the crawl dies after yielding it.
+    crawler = get_crawler(replay_server, tmp_path, failing_url=urls[1])
+    records = crawler.crawl(urls)
+    assert next(records).main_details_data
+    assert next(records).main_details_data is None
+    records.close()
+
+    crawler = get_crawler(replay_server, tmp_path)
+    assert crawler.journal.get_completed_urls() == {urls[0]}
+
+    records = list(crawler.crawl(urls))
+    assert [record['source'] for record in records] == urls
+    assert all(record.main_details_data for record in records)
+    assert crawler.journal.get_completed_urls() == set()